@@ -0,0 +1,481 @@
+#!/usr/bin/env python3
+
+# SPDX-FileCopyrightText: 2024 Helmholtz Centre for Environmental Research (UFZ)
+#
+# SPDX-License-Identifier: EUPL-1.2
+
+"""
+Minimal in-memory stand-in for the PostgREST API of the RSD.
+
+Only the tables, query features and the migrate_spotlight function used by
+the migration script are implemented. Every request can be delayed by a
+configurable latency to emulate a remote RSD instance, and a share of the
+requests can be rejected to test retries.
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+# table -> (primary key, unique column sets, foreign keys (column -> table.column))
+TABLES = {
+    "software": ("id", [("slug",)], {}),
+    "keyword": ("id", [("value",)], {}),
+    "image": ("id", [], {}),
+    "organisation": ("id", [("slug",)], {"logo_id": ("image", "id")}),
+    "repository_url": (
+        "software",
+        [],
+        {"software": ("software", "id")},
+    ),
+    "license_for_software": (
+        "id",
+        [("software", "license")],
+        {"software": ("software", "id")},
+    ),
+    "keyword_for_software": (
+        None,
+        [("software", "keyword")],
+        {"software": ("software", "id"), "keyword": ("keyword", "id")},
+    ),
+    "software_for_organisation": (
+        None,
+        [("software", "organisation")],
+        {"software": ("software", "id"), "organisation": ("organisation", "id")},
+    ),
+    "maintainer_for_software": (None, [], {"software": ("software", "id")}),
+    "release": ("software", [], {"software": ("software", "id")}),
+    "release_version": (None, [], {"release_id": ("release", "software")}),
+    "contributor": ("id", [], {"software": ("software", "id")}),
+    "software_highlight": ("software", [], {"software": ("software", "id")}),
+    "meta_pages": ("id", [("slug",)], {}),
+}
+
+
+class ApiError(Exception):
+    """Error response of the API."""
+
+    def __init__(self, status, code, message, details=None):
+        super().__init__(message)
+        self.status = status
+        self.body = {"code": code, "message": message, "details": details, "hint": None}
+
+
+def parse_list(value):
+    """Parse the value list of an ``in.(...)`` filter."""
+    values = []
+    current = ""
+    quoted = False
+    for char in value:
+        if char == '"':
+            quoted = not quoted
+        elif char == "," and not quoted:
+            values.append(current)
+            current = ""
+        else:
+            current += char
+    values.append(current)
+    return values
+
+
+def matches(row, column, expression):
+    """Check whether a row matches a filter like ``column=eq.value``."""
+    negate = expression.startswith("not.")
+    if negate:
+        expression = expression[4:]
+    operator, _, operand = expression.partition(".")
+    value = row.get(column)
+    if operator == "eq":
+        result = value is not None and str(value) == operand
+    elif operator == "neq":
+        result = value is not None and str(value) != operand
+    elif operator == "in":
+        result = value is not None and str(value) in parse_list(operand[1:-1])
+    elif operator == "is":
+        result = value is None if operand == "null" else str(value) == operand
+    else:
+        raise ApiError(400, "PGRST100", f"Unsupported operator {operator}")
+    return not result if negate else result
+
+
+class Database:
+    """The tables of the RSD and the requests sent to them."""
+
+    def __init__(self, functions=True):
+        self.lock = threading.Lock()
+        self.tables = {name: [] for name in TABLES}
+        # (method, table or rpc/function) -> number of requests
+        self.requests = Counter()
+        self.functions = functions
+        self.injected_failures = 0
+
+    def rows(self, table):
+        if table not in self.tables:
+            raise ApiError(404, "42P01", f'relation "{table}" does not exist')
+        return self.tables[table]
+
+    def select(self, table, filters):
+        return [
+            row
+            for row in self.rows(table)
+            if all(matches(row, col, expr) for col, expr in filters)
+        ]
+
+    def check_foreign_keys(self, table, row):
+        for column, (ref_table, ref_column) in TABLES[table][2].items():
+            value = row.get(column)
+            if value is None:
+                continue
+            if not any(r.get(ref_column) == value for r in self.tables[ref_table]):
+                raise ApiError(
+                    409,
+                    "23503",
+                    f'insert or update on table "{table}" violates foreign key '
+                    f'constraint "{table}_{column}_fkey"',
+                )
+
+    def find_conflict(self, table, row, on_conflict=None):
+        pk, uniques, _ = TABLES[table]
+        keys = [tuple(on_conflict.split(","))] if on_conflict else []
+        if pk is not None:
+            keys.append((pk,))
+        keys.extend(uniques)
+        for columns in keys:
+            for existing in self.tables[table]:
+                if all(
+                    existing.get(c) is not None and existing.get(c) == row.get(c)
+                    for c in columns
+                ):
+                    return existing
+        return None
+
+    def insert(self, table, rows, resolution=None, on_conflict=None):
+        self.rows(table)
+        pk = TABLES[table][0]
+        if rows:
+            columns = set(rows[0])
+            if any(set(row) != columns for row in rows):
+                raise ApiError(400, "PGRST102", "All object keys must match")
+        created = []
+        staged = list(self.tables[table])
+        original = self.tables[table]
+        self.tables[table] = staged
+        try:
+            for data in rows:
+                row = dict(data)
+                if table == "image" and "id" not in row:
+                    # like the insert trigger of the RSD, sha1(data::bytea)
+                    data = row.get("data", "").encode("utf-8")
+                    row["id"] = hashlib.sha1(data).hexdigest()
+                if table == "software_for_organisation":
+                    row.setdefault("status", "approved")
+                self.check_foreign_keys(table, row)
+                conflict = self.find_conflict(table, row, on_conflict)
+                if conflict is not None:
+                    if resolution == "ignore-duplicates":
+                        continue
+                    if resolution == "merge-duplicates":
+                        conflict.update(row)
+                        created.append(conflict)
+                        continue
+                    raise ApiError(
+                        409,
+                        "23505",
+                        f'duplicate key value violates unique constraint on "{table}"',
+                    )
+                if pk == "id" and row.get("id") is None:
+                    row["id"] = str(uuid.uuid4())
+                staged.append(row)
+                created.append(row)
+        except ApiError:
+            self.tables[table] = original
+            raise
+        return created
+
+    def update(self, table, filters, data):
+        rows = self.select(table, filters)
+        for row in rows:
+            candidate = dict(row, **data)
+            self.check_foreign_keys(table, candidate)
+            row.update(data)
+        return rows
+
+    def delete(self, table, filters):
+        rows = self.select(table, filters)
+        for other, (_, _, foreign_keys) in TABLES.items():
+            for column, (ref_table, ref_column) in foreign_keys.items():
+                if ref_table != table:
+                    continue
+                referenced = {row.get(ref_column) for row in rows}
+                if any(r.get(column) in referenced for r in self.tables[other]):
+                    raise ApiError(
+                        409,
+                        "23503",
+                        f'update or delete on table "{table}" violates foreign key '
+                        f'constraint "{other}_{column}_fkey" on table "{other}"',
+                    )
+        ids = {id(row) for row in rows}
+        self.tables[table] = [r for r in self.tables[table] if id(r) not in ids]
+        return rows
+
+    def migrate_spotlight(self, payload):
+        """Emulate the SQL function of resources/migrate_spotlight.sql."""
+        backup = {
+            name: [dict(row) for row in rows] for name, rows in self.tables.items()
+        }
+        try:
+            return self._migrate_spotlight(payload)
+        except ApiError:
+            self.tables = backup
+            raise
+
+    def _migrate_spotlight(self, payload):
+        data = payload["software"]
+        columns = (
+            "slug",
+            "brand_name",
+            "concept_doi",
+            "description",
+            "get_started_url",
+            "is_published",
+            "short_statement",
+        )
+        values = {column: data.get(column) for column in columns}
+        existing = self.select("software", [("slug", "eq." + str(values["slug"]))])
+        created = len(existing) == 0
+        if created:
+            [row] = self.insert("software", [values])
+            changed = True
+        else:
+            row = existing[0]
+            changed = any(row.get(c) != v for c, v in values.items())
+            row.update(values)
+        software_id = row["id"]
+        own = [("software", "eq." + software_id)]
+
+        repository = payload.get("repository_url")
+        current = self.select("repository_url", own)
+        if repository is None:
+            changed |= len(self.delete("repository_url", own)) > 0
+        elif len(current) == 0:
+            self.insert("repository_url", [{"software": software_id, **repository}])
+            changed = True
+        elif any(current[0].get(k) != v for k, v in repository.items()):
+            current[0].update(repository)
+            changed = True
+
+        def sync(table, column, desired):
+            nonlocal changed
+            current = {row[column] for row in self.select(table, own)}
+            removed = [v for v in current if v not in desired]
+            if removed:
+                self.delete(table, own + [(column, "in.(%s)" % ",".join(removed))])
+                changed = True
+            added = [v for v in dict.fromkeys(desired) if v not in current]
+            if added:
+                self.insert(
+                    table, [{"software": software_id, column: v} for v in added]
+                )
+                changed = True
+
+        sync("license_for_software", "license", payload.get("licenses", []))
+
+        keywords = payload.get("keywords", [])
+        known = {row["value"].lower() for row in self.tables["keyword"]}
+        new = {}
+        for keyword in keywords:
+            if keyword.lower() not in known:
+                new.setdefault(keyword.lower(), keyword)
+        self.insert("keyword", [{"value": value} for value in new.values()])
+        wanted = {keyword.lower() for keyword in keywords}
+        kw_ids = [
+            row["id"]
+            for row in self.tables["keyword"]
+            if row["value"].lower() in wanted
+        ]
+        sync("keyword_for_software", "keyword", kw_ids)
+
+        sync(
+            "software_for_organisation",
+            "organisation",
+            payload.get("organisations", []),
+        )
+        return [{"software_id": software_id, "created": created, "changed": changed}]
+
+
+def project(rows, select):
+    if not select or select == "*":
+        return [dict(row) for row in rows]
+    columns = [c for c in select.split(",") if "(" not in c]
+    return [{c: row.get(c) for c in columns} for row in rows]
+
+
+def make_handler(db, latency, failure_rate=0.0):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        def send_json(self, status, body, headers=None):
+            payload = b"" if body is None else json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def parse(self):
+            url = urlsplit(self.path)
+            parts = url.path.strip("/").split("/")
+            params = parse_qsl(url.query, keep_blank_values=True)
+            length = int(self.headers.get("Content-Length") or 0)
+            raw = self.rfile.read(length) if length else b""
+            body = json.loads(raw) if raw else None
+            prefer = self.headers.get("Prefer", "")
+            return parts, params, body, prefer
+
+        def handle_request(self, method):
+            if latency:
+                time.sleep(latency)
+            try:
+                parts, params, body, prefer = self.parse()
+                if failure_rate and random.random() < failure_rate:
+                    db.injected_failures += 1
+                    raise ApiError(503, "PGRST001", "Database client error")
+                table = parts[-1]
+                if len(parts) >= 2 and parts[-2] == "rpc":
+                    db.requests[(method, "rpc/" + table)] += 1
+                    if table != "migrate_spotlight" or not db.functions:
+                        raise ApiError(404, "PGRST202", f"Function {table} not found")
+                    with db.lock:
+                        result = db.migrate_spotlight(body["payload"])
+                    self.send_json(200, result)
+                    return
+                db.requests[(method, table)] += 1
+                filters = [
+                    (key, value)
+                    for key, value in params
+                    if key not in ("select", "limit", "offset", "order", "on_conflict")
+                ]
+                options = dict(params)
+                with db.lock:
+                    status, rows, headers = self.dispatch(
+                        method, table, filters, options, body, prefer
+                    )
+                minimal = "return=minimal" in prefer
+                if minimal and status == 200:
+                    status = 204
+                self.send_json(status, None if minimal else rows, headers)
+            except ApiError as exc:
+                self.send_json(exc.status, exc.body)
+            except Exception as exc:
+                self.send_json(500, {"code": "XX000", "message": repr(exc)})
+
+        def dispatch(self, method, table, filters, options, body, prefer):
+            select = options.get("select")
+            if method in ("GET", "HEAD"):
+                rows = db.select(table, filters)
+                total = len(rows)
+                start = int(options.get("offset", 0))
+                end = None
+                if "limit" in options:
+                    end = start + int(options["limit"])
+                range_header = self.headers.get("Range")
+                if range_header:
+                    first, _, last = range_header.partition("-")
+                    start = int(first)
+                    end = int(last) + 1 if last else None
+                rows = rows[start:end]
+                last = start + len(rows) - 1
+                headers = {"Content-Range": f"{start}-{last}/{total}"}
+                return 200, project(rows, select), headers
+            if method == "POST":
+                rows = body if isinstance(body, list) else [body]
+                resolution = None
+                for item in prefer.split(","):
+                    if item.strip().startswith("resolution="):
+                        resolution = item.strip().split("=", 1)[1]
+                created = db.insert(table, rows, resolution, options.get("on_conflict"))
+                return 201, project(created, select), {}
+            if method == "PATCH":
+                return 200, project(db.update(table, filters, body), select), {}
+            if method == "DELETE":
+                return 200, project(db.delete(table, filters), select), {}
+            raise ApiError(405, "PGRST117", f"Unsupported method {method}")
+
+        def do_GET(self):
+            self.handle_request("GET")
+
+        def do_HEAD(self):
+            self.handle_request("HEAD")
+
+        def do_POST(self):
+            self.handle_request("POST")
+
+        def do_PATCH(self):
+            self.handle_request("PATCH")
+
+        def do_DELETE(self):
+            self.handle_request("DELETE")
+
+    return Handler
+
+
+def serve(host="127.0.0.1", port=0, latency=0.0, db=None, failure_rate=0.0):
+    """Start the server in a background thread and return it with its database."""
+    db = db or Database()
+    server = ThreadingHTTPServer((host, port), make_handler(db, latency, failure_rate))
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, db
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--port", type=int, default=3500, help="Port to listen on (default: 3500)."
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.0,
+        metavar="SECONDS",
+        help="Delay of every request (default: 0).",
+    )
+    parser.add_argument(
+        "--failures",
+        type=float,
+        default=0.0,
+        metavar="RATE",
+        help="Share of requests answered with 503 Service Unavailable (default: 0).",
+    )
+    parser.add_argument(
+        "--no-functions",
+        action="store_true",
+        help="Emulate an RSD without the migrate_spotlight function.",
+    )
+    args = parser.parse_args()
+    server, db = serve(
+        port=args.port,
+        latency=args.latency,
+        db=Database(functions=not args.no_functions),
+        failure_rate=args.failures,
+    )
+    print("Listening on http://127.0.0.1:%d" % server.server_address[1])
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+
+# SPDX-FileCopyrightText: 2024 Helmholtz Centre for Environmental Research (UFZ)
+#
+# SPDX-License-Identifier: EUPL-1.2
+
+"""
+Generate a directory of synthetic spotlight files.
+
+The spotlights use the front matter and HTML of the real spotlights, with
+random centres, keywords, licenses and platforms. The same seed always
+creates the same files.
+"""
+
+import argparse
+import os
+import random
+
+CENTRES = [
+    "Helmholtz Centre for Environmental Research (UFZ)",
+    "Helmholtz Centre Potsdam GFZ German Research Centre for Geosciences",
+    "German Aerospace Center (DLR)",
+    "Alfred Wegener Institute for Polar and Marine Research (AWI)",
+    "Karlsruhe Institute of Technology (KIT)",
+    "CISPA Helmholtz Center for Information Security",
+    "Helmholtz Centre for Heavy Ion Research (GSI)",
+    "Helmholtz Centre For Ocean Research Kiel (GEOMAR)",
+    "Helmholtz-Zentrum Dresden-Rossendorf",
+    "Forschungszentrum Jülich",
+    "Deutsches Elektronen-Synchrotron DESY",
+    "German Cancer Research Center (DKFZ)",
+]
+RESEARCH_FIELDS = [
+    "Earth and Environment",
+    "Energy",
+    "Health",
+    "Information",
+    "Matter",
+    "Aeronautics, Space and Transport",
+]
+KEYWORDS = [
+    "Python",
+    "C++",
+    "Simulation",
+    "Data Analysis",
+    "Machine Learning",
+    "Visualization",
+    "HPC",
+    "Climate",
+    "Workflow",
+    "Geophysics",
+    "Imaging",
+    "Open Science",
+    "FAIR",
+    "Julia",
+    "Fortran",
+]
+LICENSES = ["MIT", "GPL-3.0-or-later", "Apache-2.0", "BSD-3-Clause", "EUPL-1.2"]
+
+PARAGRAPH = (
+    "The {name} toolkit provides reusable building blocks for research\n"
+    "software engineers. It was developed at <b>{centre}</b> and is used\n"
+    'in several projects (see <a href="https://example.org/{slug}">the\n'
+    'project page</a>). <i class="fas fa-info"></i> Version 1.0 adds\n'
+    "support for <i>parallel</i> execution and <tt>config.yml</tt> files.\n"
+)
+CODE = "```python\nimport {slug}\n\n{slug}.run(\n    threads=4,\n)\n```\n"
+IMAGE = (
+    '<img src="{{{{ site.directory.images | relative_url}}}}/spotlights/'
+    '{slug}/screenshot.png" alt="{name} screenshot">\n'
+)
+
+
+def render(index, rng, paragraphs):
+    """Return the name and the content of a spotlight."""
+    name = f"Synthetic Tool {index:05d}"
+    slug = name.lower().replace(" ", "-")
+    centres = rng.sample(CENTRES, rng.randint(1, 3))
+    keywords = rng.sample(KEYWORDS, rng.randint(0, 5))
+    lines = [
+        "---",
+        f"name: {name}",
+        f"preview_image: {slug}/preview.png",
+        f"excerpt: {name} is a synthetic spotlight used for benchmarking.",
+        "date_added: 2024-03-19",
+        "platforms:",
+    ]
+    if rng.random() < 0.5:
+        lines += ["  - type: gitlab", f"    link_as: https://gitlab.example.org/{slug}"]
+    else:
+        lines += ["  - type: github", f"    link_as: https://github.com/example/{slug}"]
+    if rng.random() < 0.7:
+        lines += ["  - type: webpage", f"    link_as: https://{slug}.example.org"]
+    if rng.random() < 0.9:
+        lines.append(f"license: {rng.choice(LICENSES)}")
+    if rng.random() < 0.5:
+        lines.append(f"doi: 10.5281/zenodo.{1000000 + index}")
+    if keywords:
+        lines.append("keywords:")
+        lines += [f'  - "{kw}"' for kw in keywords]
+    if len(centres) == 1:
+        lines.append(f"hgf_centers: {centres[0]}")
+    else:
+        lines.append("hgf_centers:")
+        lines += [f"  - {centre}" for centre in centres]
+    lines.append(f"hgf_research_field: {rng.choice(RESEARCH_FIELDS)}")
+    lines.append("---")
+    lines.append("")
+    body = []
+    for i in range(paragraphs):
+        body.append(PARAGRAPH.format(name=name, slug=slug, centre=centres[0]))
+        if i % 3 == 1:
+            body.append(CODE.format(slug=slug.replace("-", "_")))
+        if i % 4 == 2:
+            body.append(IMAGE.format(slug=slug, name=name))
+        body.append("\n<p>\n")
+    return name, "\n".join(lines) + "\n" + "".join(body)
+
+
+def generate(directory, count, paragraphs=3, seed=0):
+    """Write count spotlights to directory."""
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    for index in range(count):
+        _, content = render(index, rng, paragraphs)
+        with open(
+            os.path.join(directory, f"spotlight-{index:05d}.md"), "w", encoding="utf-8"
+        ) as f:
+            f.write(content)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("DIR", help="Directory for the spotlight files.")
+    parser.add_argument(
+        "-n",
+        "--number",
+        type=int,
+        default=100,
+        help="Number of spotlights (default: 100).",
+    )
+    parser.add_argument(
+        "--paragraphs",
+        type=int,
+        default=3,
+        help="Number of paragraphs of every spotlight (default: 3).",
+    )
+    parser.add_argument(
+        "--seed", type=int, default=0, help="Seed of the random choices (default: 0)."
+    )
+    args = parser.parse_args()
+    generate(args.DIR, args.number, args.paragraphs, args.seed)
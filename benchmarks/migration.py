@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+
+# SPDX-FileCopyrightText: 2024 Helmholtz Centre for Environmental Research (UFZ)
+#
+# SPDX-License-Identifier: EUPL-1.2
+
+"""
+End-to-end benchmark of the spotlight migration.
+
+Runs main.py against the fake PostgREST server of fake_postgrest.py and
+reports the wall time and the requests per table and per spotlight of every
+run. Options after "--" are passed to main.py, e.g.
+
+    python benchmarks/migration.py -n 500 --latency 0.01 -- --concurrency 8
+
+Unless a directory is given with --spotlights, a synthetic corpus is
+generated with generate_spotlights.py.
+"""
+
+import argparse
+import glob
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import fake_postgrest
+from generate_spotlights import generate
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_migration(url, spotlights, tmp, options, verbose=False):
+    """Run main.py once and return the wall time and its exit code."""
+    env = dict(os.environ, POSTGREST_URL=url, PGRST_JWT_SECRET="benchmark")
+    command = [
+        sys.executable,
+        os.path.join(ROOT, "main.py"),
+        "--state",
+        os.path.join(tmp, "state.json"),
+        "--journal",
+        os.path.join(tmp, "journal.jsonl"),
+        *options,
+    ]
+    if "--apply" not in options:
+        command.append(spotlights)
+
+    start = time.perf_counter()
+    process = subprocess.run(
+        command,
+        cwd=ROOT,
+        env=env,
+        stdout=None if verbose else subprocess.DEVNULL,
+        stderr=None if verbose else subprocess.DEVNULL,
+    )
+    return time.perf_counter() - start, process.returncode
+
+
+def report(index, duration, returncode, requests, injected, count):
+    """Print the results of a run and return them as a dictionary."""
+    total = sum(requests.values())
+    tables = {}
+    for (method, table), number in requests.items():
+        tables.setdefault(table, {})[method] = number
+
+    print(
+        "Run %d: %.2f s, %d requests, %.1f requests per spotlight%s%s"
+        % (
+            index,
+            duration,
+            total,
+            total / count if count else 0,
+            ", %d failures injected" % injected if injected else "",
+            ", exit code %d" % returncode if returncode else "",
+        )
+    )
+    for table, methods in sorted(tables.items()):
+        print(
+            "  %-28s %6d  (%s)"
+            % (
+                table,
+                sum(methods.values()),
+                ", ".join("%d %s" % (n, m) for m, n in sorted(methods.items())),
+            )
+        )
+
+    return {
+        "duration": duration,
+        "returncode": returncode,
+        "requests": total,
+        "requests_per_spotlight": total / count if count else 0,
+        "injected_failures": injected,
+        "tables": tables,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip().splitlines()[0],
+        usage="%(prog)s [options] [-- MAIN_OPTIONS ...]",
+    )
+    parser.add_argument(
+        "-n",
+        "--number",
+        type=int,
+        default=100,
+        help="Number of synthetic spotlights (default: 100).",
+    )
+    parser.add_argument(
+        "--spotlights",
+        metavar="DIR",
+        help="Migrate the spotlights in DIR instead of a synthetic corpus.",
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.0,
+        metavar="SECONDS",
+        help="Delay of every request to the fake server (default: 0).",
+    )
+    parser.add_argument(
+        "--failures",
+        type=float,
+        default=0.0,
+        metavar="RATE",
+        help="Share of requests rejected by the fake server (default: 0).",
+    )
+    parser.add_argument(
+        "--no-functions",
+        action="store_true",
+        help="Emulate an RSD without the migrate_spotlight function.",
+    )
+    parser.add_argument(
+        "-r",
+        "--runs",
+        type=int,
+        default=1,
+        help="Number of runs against the same database, e.g. 2 to measure a "
+        "run without changes after the initial migration (default: 1).",
+    )
+    parser.add_argument(
+        "--json", metavar="FILE", help="Write the results of all runs to FILE."
+    )
+    parser.add_argument(
+        "-v", "--verbose", action="store_true", help="Show the output of main.py."
+    )
+    parser.add_argument("options", nargs="*", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    server, db = fake_postgrest.serve(
+        latency=args.latency,
+        db=fake_postgrest.Database(functions=not args.no_functions),
+        failure_rate=args.failures,
+    )
+    url = "http://%s:%d" % server.server_address
+
+    with tempfile.TemporaryDirectory() as tmp:
+        spotlights = args.spotlights
+        if spotlights is None:
+            spotlights = os.path.join(tmp, "spotlights")
+            generate(spotlights, args.number)
+        count = len(glob.glob(os.path.join(spotlights, "*.md")))
+        print("Migrating %d spotlights with options %s" % (count, args.options))
+
+        results = []
+        for index in range(1, args.runs + 1):
+            db.requests.clear()
+            injected = db.injected_failures
+            duration, returncode = run_migration(
+                url,
+                spotlights,
+                tmp,
+                args.options,
+                args.verbose,
+            )
+            results.append(
+                report(
+                    index,
+                    duration,
+                    returncode,
+                    db.requests,
+                    db.injected_failures - injected,
+                    count,
+                )
+            )
+
+    server.shutdown()
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"spotlights": count, "runs": results}, f, indent=2)
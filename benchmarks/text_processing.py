@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+
+# SPDX-FileCopyrightText: 2024 Helmholtz Centre for Environmental Research (UFZ)
+#
+# SPDX-License-Identifier: EUPL-1.2
+
+"""
+Micro-benchmark of the text processing of the spotlight migration.
+
+Compares the current implementation of unwrapping paragraphs and creating
+slugs with the previous one, which split the document at every code fence
+and compiled its patterns on every call.
+"""
+
+import argparse
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+
+PARAGRAPH = (
+    "The toolkit provides reusable building blocks for research\n"
+    "software engineers. It is used in several projects (see\n"
+    "[the project page](https://example.org)) and supports *parallel*\n"
+    "execution and `config.yml` files.\n\n"
+)
+CODE = "```python\nimport toolkit\n\ntoolkit.run(\n    threads=4,\n)\n```\n\n"
+NAMES = [f"Synthetic Tool {i:03d}" for i in range(100)]
+
+
+def legacy_unwrap_paragraphs(markdown):
+    md_split = markdown.split(r"```")
+    if len(md_split) % 2 == 0:
+        raise Exception("There was an error parsing markdown code blocks")
+
+    for i in range(0, len(md_split), 2):
+        md_split[i] = re.sub(
+            r"(?<=[\w., \(\)\[\]])(\n)(?=[\w.,\(\)\[\]])", " ", md_split[i]
+        )
+
+    return "```".join(md_split)
+
+
+def legacy_name_to_slug(name):
+    remove_chars = name.lower()
+
+    replacements = [
+        (r"\s+", "-"),
+        (r"[^A-Za-z0-9_ ]+", ""),
+        (r"\-+", "-"),
+    ]
+
+    for pattern, replace in replacements:
+        remove_chars = re.sub(pattern, replace, remove_chars)
+
+    return remove_chars
+
+
+def slugify_all(name_to_slug):
+    # every spotlight name is turned into a slug several times during a run
+    for _ in range(7):
+        for name in NAMES:
+            name_to_slug(name)
+
+
+def report(label, legacy, current, number):
+    legacy_time = min(timeit.repeat(legacy, number=number, repeat=5))
+    current_time = min(timeit.repeat(current, number=number, repeat=5))
+    print(
+        "%-24s legacy %8.2f ms  current %8.2f ms  speed-up %5.1fx"
+        % (
+            label,
+            1000 * legacy_time / number,
+            1000 * current_time / number,
+            legacy_time / current_time,
+        )
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "-s",
+        "--size",
+        type=int,
+        default=100,
+        help="Number of paragraphs in the benchmark document (default: 100).",
+    )
+    parser.add_argument(
+        "-n",
+        "--number",
+        type=int,
+        default=100,
+        help="Number of calls per measurement (default: 100).",
+    )
+    args = parser.parse_args()
+
+    document = "".join(
+        PARAGRAPH + (CODE if i % 3 == 0 else "") for i in range(args.size)
+    )
+    assert legacy_unwrap_paragraphs(document) == main.unwrap_paragraphs(document, "")
+    assert all(legacy_name_to_slug(n) == main.name_to_slug(n) for n in NAMES)
+
+    print("Document with %d characters" % len(document))
+    report(
+        "unwrap_paragraphs",
+        lambda: legacy_unwrap_paragraphs(document),
+        lambda: main.unwrap_paragraphs(document, ""),
+        args.number,
+    )
+    report(
+        "name_to_slug",
+        lambda: slugify_all(legacy_name_to_slug),
+        lambda: slugify_all(main.name_to_slug),
+        args.number,
+    )
@@ -0,0 +1,221 @@
+# SPDX-FileCopyrightText: 2024 Helmholtz Centre for Environmental Research (UFZ)
+#
+# SPDX-License-Identifier: EUPL-1.2
+
+"""
+PostgREST client with connection reuse, timeouts and retries.
+"""
+
+import asyncio
+import logging
+import random
+import time
+from collections import Counter, defaultdict
+
+import httpx
+from postgrest import AsyncPostgrestClient
+
+from metrics import Histogram
+
+try:
+    # HTTP/2 is only available with the optional h2 package
+    import h2  # noqa: F401
+
+    HTTP2 = True
+except ImportError:
+    HTTP2 = False
+
+# methods which can be sent again without changing the result
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+# responses to requests which were not processed by the server
+RETRY_ALWAYS_STATUS_CODES = frozenset({429, 503})
+# responses to requests which may have been processed nevertheless
+RETRY_IDEMPOTENT_STATUS_CODES = frozenset({502, 504})
+
+
+def request_table(request: httpx.Request) -> str:
+    """Return the table or the function (rpc/<name>) a request is sent to."""
+    parts = request.url.path.rstrip("/").split("/")
+    if len(parts) >= 2 and parts[-2] == "rpc":
+        return "rpc/" + parts[-1]
+    return parts[-1]
+
+
+class RequestStats:
+    """Counters of the requests sent to the RSD, by method and table."""
+
+    def __init__(self) -> None:
+        # latencies of all attempts, including retries
+        self.latencies = defaultdict(Histogram)
+        self.bytes_sent = Counter()
+        self.bytes_received = Counter()
+        self.retries = Counter()
+        self.failures = Counter()
+
+    def summary(self) -> str:
+        latencies = Histogram()
+        methods = Counter()
+        for (method, _), histogram in self.latencies.items():
+            latencies.values.extend(histogram.values)
+            methods[method] += histogram.count
+        if latencies.count == 0:
+            return "No requests sent."
+
+        retries = ", ".join(
+            "%d %s" % (count, reason) for reason, count in self.retries.most_common()
+        )
+        return (
+            "%d requests (%s), %d retries%s, %d failed, latency mean %.1f ms, "
+            "p95 %.1f ms, max %.1f ms"
+            % (
+                latencies.count,
+                ", ".join(
+                    "%d %s" % (count, method)
+                    for method, count in sorted(methods.items())
+                ),
+                sum(self.retries.values()),
+                " (%s)" % retries if retries else "",
+                sum(self.failures.values()),
+                1000 * latencies.mean(),
+                1000 * latencies.quantile(0.95),
+                1000 * latencies.max(),
+            )
+        )
+
+
+class CountingStream(httpx.AsyncByteStream):
+    """Response stream which counts the bytes received."""
+
+    def __init__(self, stream: httpx.AsyncByteStream, stats: RequestStats, key):
+        self.stream = stream
+        self.stats = stats
+        self.key = key
+
+    async def __aiter__(self):
+        async for chunk in self.stream:
+            self.stats.bytes_received[self.key] += len(chunk)
+            yield chunk
+
+    async def aclose(self) -> None:
+        await self.stream.aclose()
+
+
+class RetryTransport(httpx.AsyncBaseTransport):
+    """
+    Retry failed requests with jittered exponential backoff.
+
+    Requests which did not reach the server or were rejected before being
+    processed are retried regardless of their method, all other failures
+    only for idempotent methods.
+    """
+
+    def __init__(
+        self,
+        transport: httpx.AsyncBaseTransport,
+        *,
+        retries: int = 3,
+        backoff: float = 0.5,
+        max_backoff: float = 30.0,
+        stats: RequestStats = None,
+    ) -> None:
+        self.transport = transport
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.stats = RequestStats() if stats is None else stats
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        idempotent = request.method in IDEMPOTENT_METHODS
+        key = (request.method, request_table(request))
+        attempt = 0
+
+        while True:
+            self.stats.bytes_sent[key] += len(request.content)
+            start = time.perf_counter()
+            try:
+                response = await self.transport.handle_async_request(request)
+            except (httpx.ConnectError, httpx.ConnectTimeout) as exc:
+                retry, reason, error = True, type(exc).__name__, exc
+            except httpx.TransportError as exc:
+                retry, reason, error = idempotent, type(exc).__name__, exc
+            else:
+                status = response.status_code
+                retry = status in RETRY_ALWAYS_STATUS_CODES or (
+                    idempotent and status in RETRY_IDEMPOTENT_STATUS_CODES
+                )
+                reason, error = "HTTP %d" % status, None
+            finally:
+                self.stats.latencies[key].observe(time.perf_counter() - start)
+
+            if not retry or attempt >= self.retries:
+                if error is not None or response.status_code >= 400:
+                    self.stats.failures[key] += 1
+                if error is not None:
+                    raise error
+                response.stream = CountingStream(response.stream, self.stats, key)
+                return response
+
+            delay = random.uniform(0, min(self.max_backoff, self.backoff * 2**attempt))
+            if error is None:
+                retry_after = response.headers.get("Retry-After", "")
+                if retry_after.isdigit():
+                    delay = max(delay, float(retry_after))
+                await response.aclose()
+
+            attempt += 1
+            self.stats.retries[reason] += 1
+            logging.warning(
+                "%s %s failed with %s, retrying in %.1f s (%d of %d)",
+                request.method,
+                request.url.path,
+                reason,
+                delay,
+                attempt,
+                self.retries,
+            )
+            await asyncio.sleep(delay)
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+class RetryingPostgrestClient(AsyncPostgrestClient):
+    """
+    AsyncPostgrestClient with a tuned connection pool and retries.
+
+    Up to max_connections connections are kept open between requests. The
+    timeout applies to connecting, sending and receiving, but not to
+    waiting for a free connection of the pool.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        *,
+        retries: int = 3,
+        timeout: float = 30.0,
+        max_connections: int = 20,
+        keepalive_expiry: float = 30.0,
+        stats: RequestStats = None,
+    ) -> None:
+        self.retries = retries
+        self.max_connections = max_connections
+        self.keepalive_expiry = keepalive_expiry
+        self.stats = RequestStats() if stats is None else stats
+        super().__init__(base_url, timeout=httpx.Timeout(timeout, pool=None))
+
+    def create_session(self, base_url, headers, timeout) -> httpx.AsyncClient:
+        transport = httpx.AsyncHTTPTransport(
+            http2=HTTP2,
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_connections,
+                keepalive_expiry=self.keepalive_expiry,
+            ),
+        )
+        return httpx.AsyncClient(
+            base_url=base_url,
+            headers=headers,
+            timeout=timeout,
+            transport=RetryTransport(transport, retries=self.retries, stats=self.stats),
+        )
@@ -12,26 +12,62 @@ Migration script for the spotlights from the hifis.net website.
 import argparse
 import asyncio
 import base64
+import contextlib
+import functools
 import glob
+import hashlib
+import io
+import json
 import logging
+import multiprocessing
 import os
+import pickle
 import re
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
+import httpx
 import jwt
 import magic
 import yaml
-from postgrest import APIError, AsyncPostgrestClient
+from postgrest import APIError
+from postgrest.types import CountMethod, ReturnMethod
 
+from client import RequestStats, RetryingPostgrestClient
 from mdparser.mdparser import SvHtmlParser
+from metrics import PhaseStats, format_table, write_metrics
+
+try:
+    # use the much faster libyaml based loader if available
+    from yaml import CSafeLoader as YamlLoader
+except ImportError:
+    from yaml import SafeLoader as YamlLoader
 
 VERBOSE = False
 DELETE_SPOTLIGHTS = False
 UPDATE_IMPRINT = False
+CONCURRENCY = 1
+PARSE_WORKERS = 1
+# number of threads reading the spotlight files
+READ_WORKERS = 8
+PARSE_CACHE = None
+# increase whenever the conversion of spotlights changes to invalidate caches
+PARSE_CACHE_VERSION = 5
 POSTGREST_URL = os.environ.get("POSTGREST_URL")
 PGRST_JWT_SECRET = os.environ.get("PGRST_JWT_SECRET")
 JWT_PAYLOAD = {"role": "rsd_admin"}
 JWT_ALGORITHM = "HS256"
 
+# Connection pool, timeout in seconds and retries of failed requests
+MAX_CONNECTIONS = 20
+TIMEOUT = 30.0
+RETRIES = 3
+REQUEST_STATS = RequestStats()
+PHASE_STATS = PhaseStats()
+# file to export the metrics to, see metrics.write_metrics
+METRICS_FILE = None
+
 ORGANISATIONS = {
     "Helmholtz Centre for Environmental Research (UFZ)": {
         "logo": "UFZ.svg",
@@ -84,90 +120,360 @@ ORGANISATIONS = {
 }
 MISSING_LOGOS = []
 
+# Software ids known in this run, indexed by slug. Filled from lookups and
+# from the rows returned when a software entry is inserted. Once all existing
+# software has been fetched, the index is complete and a missing slug means
+# that there is no such software.
+SOFTWARE_IDS = {}
+SOFTWARE_IDS_COMPLETE = False
+# Keyword ids indexed by the lower case keyword, as keywords are unique
+# regardless of their case in the RSD.
+KEYWORD_IDS = {}
+# Rows of the organisations in ORGANISATIONS, indexed by name. Resolved once
+# at startup and updated when an organisation or its logo is added.
+ORGANISATION_REGISTRY = {}
+# Prepared logos indexed by file name, see load_logos
+LOGOS_DIR = "./resources/logos"
+LOGOS = {}
+PAGE_SIZE = 1000
+# maximum number of values in a single in.(...) filter
+CHUNK_SIZE = 100
+
+# Insert all new spotlights with a few array inserts per table
+BULK = False
+BULK_CHUNK_SIZE = 500
+
+# Migrate every spotlight in one transaction with the SQL function
+# migrate_spotlight, see resources/migrate_spotlight.sql
+RPC = False
+
+# Write the changes to a plan file instead of the RSD, or apply such a plan
+PLAN_FILE = None
+APPLY_FILE = None
+PLAN_VERSION = 2
+PLAN_TABLES = (
+    "keyword",
+    "organisation",
+    "software",
+    "repository_url",
+    "license_for_software",
+    "keyword_for_software",
+    "software_for_organisation",
+)
+
+UPDATE_SPOTLIGHTS = False
+
+# Content hashes of the spotlights migrated in previous runs, indexed by slug
+INCREMENTAL = False
+STATE_FILE = "spotlight-state.json"
+SPOTLIGHT_HASHES = {}
+
+# Steps of every spotlight migrated in the current run, see write_journal
+JOURNAL_FILE = "spotlight-journal.jsonl"
+JOURNAL_STREAM = None
+RESUME = False
+# Journal of the interrupted run, indexed by slug
+JOURNAL = {}
+
+# Keywords and organisations are shared between spotlights. Their lookup and
+# creation must not interleave between concurrent workers, otherwise two
+# workers may insert the same entry.
+KEYWORD_LOCK = asyncio.Lock()
+ORGANISATION_LOCK = asyncio.Lock()
+
 mime = magic.Magic(mime=True)
 
+# lines starting with --- enclose the front matter of a spotlight
+FRONT_MATTER_DELIMITER = re.compile(r"^---.*\n?", re.MULTILINE)
+# a line break between two characters of a paragraph, the line break is matched
+# first, as this is much faster than starting with the lookbehind
+PARAGRAPH_LINE_BREAK = re.compile(r"\n(?<=[\w., \(\)\[\]]\n)(?=[\w.,\(\)\[\]])")
+SLUG_REPLACEMENTS = [
+    (re.compile(r"\s+"), "-"),  # replace whitespaces
+    (re.compile(r"[^A-Za-z0-9_ ]+"), ""),  # remove non-alphanumeric chars
+    (re.compile(r"\-+"), "-"),  # remove multiple '-'
+]
+
 
-def get_md_without_front_matter(file):
-    found = 0
-    retlines = []
+def split_front_matter(content):
+    """Split the content of a spotlight file into its front matter and body."""
+    delimiters = FRONT_MATTER_DELIMITER.finditer(content)
+    start = next(delimiters, None)
+    end = next(delimiters, None)
 
-    with open(file, "r") as opened_file:
-        alllines = opened_file.readlines()
+    if end is None:
+        raise Exception("Could not find the end of the front matter")
 
-        for line in alllines:
-            if line.startswith("---"):
-                found += 1
-            elif found >= 2:
-                retlines.append(line)
+    return content[start.end() : end.start()], content[end.end() :]
 
-    raw_markdown = "".join(retlines)
 
+def convert_description(raw_markdown, file):
     # Parse to remove html tags
-    md_parser = SvHtmlParser()
+    md_parser = SvHtmlParser(stream=io.StringIO())
     md_parser.feed(raw_markdown)
 
     md_parsed = md_parser.close().to_markdown()
 
-    # Now split by code blocks
-    md_split = md_parsed.split(r"```")
-    if len(md_split) % 2 == 0:
-        raise Exception("There was an error parsing markdown code blocks in %s" % file)
+    return unwrap_paragraphs(md_parsed, file)
+
+
+def unwrap_paragraphs(markdown, file):
+    """
+    Remove line breaks inside paragraphs, because they would be rendered as <br>.
+
+    Code blocks are kept as they are. The document is scanned once from code
+    fence to code fence.
+    """
+    parts = []
+    pos = 0
+
+    while (start := markdown.find("```", pos)) >= 0:
+        end = markdown.find("```", start + 3)
+        if end < 0:
+            raise Exception(
+                "There was an error parsing markdown code blocks in %s" % file
+            )
+        parts.append(PARAGRAPH_LINE_BREAK.sub(" ", markdown[pos:start]))
+        parts.append(markdown[start : end + 3])
+        pos = end + 3
+
+    parts.append(PARAGRAPH_LINE_BREAK.sub(" ", markdown[pos:]))
+    return "".join(parts)
+
+
+def read_file(file):
+    """Return the content of a file together with its SHA-256 digest."""
+    with open(file, "rb") as opened_file:
+        content = opened_file.read()
+    return content, hashlib.sha256(content).hexdigest()
 
-    # Remove line breaks inside paragraphs, because they would be rendered as <br>
-    # Only every scond block, because we do not want to replace newlines in code blocks
-    for i in range(0, len(md_split), 2):
-        md_split[i] = re.sub(
-            r"(?<=[\w., \(\)\[\]])(\n)(?=[\w.,\(\)\[\]])", " ", md_split[i]
-        )
 
-    return "```".join(md_split)
+def try_read_file(file):
+    """Read a file and return its content and digest with the error that occurred."""
+    try:
+        return *read_file(file), None
+    except OSError as exc:
+        return None, None, "%s: %s" % (type(exc).__name__, exc)
 
 
-def get_spotlights():
+def iter_files(files, workers=None):
+    """
+    Read files concurrently in a pool of READ_WORKERS threads.
+
+    Yields every file with its content, its digest and the error that
+    occurred, in the order of files. Only as many files as there are
+    threads are read ahead of the consumer.
+    """
+    workers = workers or READ_WORKERS
+    with ThreadPoolExecutor(workers) as executor:
+        jobs = ((file, executor.submit(try_read_file, file)) for file in files)
+        for file, job in prefetch(jobs, workers):
+            yield file, *job.result()
+
+
+def list_spotlights():
+    """Return the spotlight files in SPOTLIGHTS_DIR, sorted by file name."""
     if not os.path.exists(SPOTLIGHTS_DIR):
         logging.error("Spotlights directory %s does not exist.", SPOTLIGHTS_DIR)
         raise SystemExit("Can't find Spotlights.")
 
     files = glob.glob(SPOTLIGHTS_DIR + os.sep + "*.md")
-    filtered = list(filter(lambda x: "_template.md" not in x, files))
+    return sorted(filter(lambda x: "_template.md" not in x, files))
+
+
+def load_spotlights():
+    """Read the spotlight files while they are consumed, see iter_files."""
+    return iter_files(list_spotlights())
+
+
+def parse_spotlight(file, content):
+    logging.info("Preparing %s", file)
+    front_matter, body = split_front_matter(content.decode("utf-8"))
+
+    metadata = yaml.load(front_matter, Loader=YamlLoader)
+    metadata["description"] = convert_description(body, file)
+
+    if metadata.get("name") is None:
+        raise Exception("Spotlight %s has no name" % file)
+
+    return metadata
+
+
+def try_parse_spotlight(file, content):
+    """
+    Parse a spotlight and return it together with the error that occurred and
+    the duration.
+    """
+    start = time.perf_counter()
+    try:
+        spotlight, error = parse_spotlight(file, content), None
+    except Exception as exc:
+        spotlight, error = None, "%s: %s" % (type(exc).__name__, exc)
+    return spotlight, error, time.perf_counter() - start
+
+
+def init_parse_worker(level):
+    """Configure the logging of a parse worker like in the main process."""
+    logging.basicConfig(level=level)
+
+
+def load_parse_cache():
+    """
+    Return the cached spotlights, indexed by file name.
+
+    The cache holds its version followed by one (file, digest, spotlight)
+    record per spotlight, see iter_spotlights.
+    """
+    if PARSE_CACHE is None or not os.path.exists(PARSE_CACHE):
+        return {}
+
+    entries = {}
+    try:
+        with open(PARSE_CACHE, "rb") as cache:
+            if pickle.load(cache) != PARSE_CACHE_VERSION:
+                logging.info("Ignoring parse cache %s of an older version", PARSE_CACHE)
+                return {}
+            while True:
+                try:
+                    file, digest, spotlight = pickle.load(cache)
+                except EOFError:
+                    break
+                entries[file] = (digest, spotlight)
+    except (OSError, EOFError, ValueError, pickle.UnpicklingError) as exc:
+        logging.warning("Ignoring invalid parse cache %s: %s", PARSE_CACHE, exc)
+        return {}
+
+    return entries
+
+
+def prefetch(iterable, size):
+    """
+    Iterate over iterable, taking up to size items ahead of the consumer.
+
+    Used with generators submitting jobs to an executor, so that jobs run
+    while earlier results are consumed but no more than size are pending.
+    """
+    pending = deque()
+    for item in iterable:
+        pending.append(item)
+        if len(pending) > size:
+            yield pending.popleft()
+    yield from pending
+
+
+def iter_spotlights(files):
+    """
+    Parse the spotlight files read by load_spotlights.
+
+    Yields the file name, the spotlight and the error that occurred while
+    reading or parsing it as soon as each spotlight is ready. Files whose
+    digest did not change since they were put into the parse cache are not
+    parsed again. With PARSE_WORKERS processes, a few files are parsed ahead
+    of the consumer, but not more, so the memory use does not grow with the
+    number of files. The parse cache is written while the spotlights are
+    yielded and only replaces the previous one once all have been yielded.
+    """
+    cache = load_parse_cache()
+    parsed = cached = 0
+
+    with contextlib.ExitStack() as stack:
+        cache_file = None
+        if PARSE_CACHE is not None:
+            cache_file = stack.enter_context(open(PARSE_CACHE + ".tmp", "wb"))
+            pickle.dump(PARSE_CACHE_VERSION, cache_file)
+
+        executor = None
+        if PARSE_WORKERS > 1:
+            # this runs in a thread next to the read workers, and forking a
+            # process with threads may copy held locks into the children
+            executor = stack.enter_context(
+                ProcessPoolExecutor(
+                    PARSE_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=init_parse_worker,
+                    initargs=(logging.getLogger().level,),
+                )
+            )
 
+        def submit():
+            for file, content, digest, error in files:
+                job = None
+                if (
+                    executor is not None
+                    and error is None
+                    and cache.get(file, (None,))[0] != digest
+                ):
+                    job = executor.submit(try_parse_spotlight, file, content)
+                yield file, content, digest, error, job
+
+        for file, content, digest, error, job in prefetch(submit(), 2 * PARSE_WORKERS):
+            if error is not None:
+                spotlight = None
+            elif file in cache and cache[file][0] == digest:
+                spotlight = cache.pop(file)[1]
+                cached += 1
+            else:
+                if job is not None:
+                    spotlight, error, duration = job.result()
+                else:
+                    spotlight, error, duration = try_parse_spotlight(file, content)
+                PHASE_STATS.phases["parse"].observe(duration)
+                parsed += 1
+
+            if error is not None:
+                logging.error("Could not parse %s: %s", file, error)
+            elif cache_file is not None:
+                pickle.dump((file, digest, spotlight), cache_file)
+
+            yield file, spotlight, error
+
+    logging.info("Parsed %d spotlights, took %d from the parse cache", parsed, cached)
+    if PARSE_CACHE is not None:
+        os.replace(PARSE_CACHE + ".tmp", PARSE_CACHE)
+
+
+async def iterate_in_thread(iterable):
+    """
+    Iterate over an iterable of parse results in a separate thread.
+
+    Reading and parsing the next spotlight blocks, so it must not run in
+    the event loop.
+    """
+    iterator = iter(iterable)
+    while (item := await asyncio.to_thread(next, iterator, None)) is not None:
+        yield item
+
+
+def get_spotlights(files):
+    """
+    Parse the spotlight files read by load_spotlights.
+
+    Returns the spotlights and a list of the files that could not be parsed
+    together with the error.
+    """
     spotlights = []
+    errors = []
 
-    for file in filtered:
-        with open(file, "r") as opened_file:
-            try:
-                logging.info("Preparing %s", file)
-                # https://stackoverflow.com/a/34727830
-                load_all = yaml.load_all(opened_file, Loader=yaml.FullLoader)
-
-                metadata = next(load_all)
-                metadata["description"] = get_md_without_front_matter(file)
-
-                if metadata.get("name") is None:
-                    raise Exception("Spotlight %s has no name" % file)
-
-                spotlights.append(metadata)
-            except yaml.YAMLError as exc:
-                print(exc)
+    for file, spotlight, error in iter_spotlights(files):
+        if error is not None:
+            errors.append([file, error])
+        else:
+            spotlights.append(spotlight)
 
-    return spotlights
+    return spotlights, errors
 
 
+@functools.cache
 def name_to_slug(name):
     remove_chars = name.lower()
 
-    replacements = [
-        (r"\s+", "-"),  # replace whitespaces
-        (r"[^A-Za-z0-9_ ]+", ""),  # remove non-alphanumeric chars
-        (r"\-+", "-"),  # remove multiple '-'
-    ]
-
-    for pattern, replace in replacements:
-        remove_chars = re.sub(pattern, replace, remove_chars)
+    for pattern, replace in SLUG_REPLACEMENTS:
+        remove_chars = pattern.sub(replace, remove_chars)
 
     return remove_chars
 
 
+@functools.cache
 def org_name_to_slug(name):
     name = (
         name.replace(" ", "-")
@@ -181,11 +487,61 @@ def org_name_to_slug(name):
     return name
 
 
+async def select_all(client, table, *columns):
+    """
+    Fetch all rows of a table, one page at a time.
+
+    PostgREST may return fewer rows per page than requested (db-max-rows), so
+    the rows are counted with the first page and pages are fetched until all
+    of them have been received.
+    """
+    rows = []
+    total = None
+    while True:
+        res = (
+            await client.from_(table)
+            .select(*columns, count=None if rows else CountMethod.exact)
+            .order(columns[0])
+            .range(len(rows), len(rows) + PAGE_SIZE)
+            .execute()
+        )
+        if total is None:
+            total = res.count
+        rows.extend(res.data)
+        if not res.data or (total is not None and len(rows) >= total):
+            return rows
+
+
+async def select_in(client, table, column, values, *columns):
+    """Fetch all rows of a table whose column matches one of the values."""
+    responses = await asyncio.gather(
+        *(
+            client.from_(table).select(*columns).in_(column, chunk).execute()
+            for chunk in chunks(values)
+        )
+    )
+    return [row for res in responses for row in res.data]
+
+
+async def load_software_ids(client):
+    global SOFTWARE_IDS_COMPLETE
+
+    rows = await select_all(client, "software", "id", "slug")
+    SOFTWARE_IDS.update({row["slug"]: row["id"] for row in rows})
+    SOFTWARE_IDS_COMPLETE = True
+    logging.info("Found %d existing software entries", len(rows))
+
+
+@PHASE_STATS.timed("exists-check")
 async def slug_to_id(client, slug):
+    if slug in SOFTWARE_IDS or SOFTWARE_IDS_COMPLETE:
+        return SOFTWARE_IDS.get(slug)
+
     res = await client.from_("software").select("id", "slug").eq("slug", slug).execute()
 
     if len(res.data) > 0:
-        return res.data[0].get("id")
+        SOFTWARE_IDS[slug] = res.data[0].get("id")
+        return SOFTWARE_IDS[slug]
 
     return None
 
@@ -222,6 +578,21 @@ def convert_spotlight_to_software(spotlight):
     return software
 
 
+def get_software_data(spotlight):
+    """
+    Return the software entry of a spotlight including the get started URL.
+
+    Columns which are not set by the spotlight are None, so the entries of
+    all spotlights have the same keys.
+    """
+    _, found_webpage = get_spotlight_urls(spotlight)
+    return {
+        "concept_doi": None,
+        **convert_spotlight_to_software(spotlight),
+        "get_started_url": found_webpage,
+    }
+
+
 async def spotlight_exists(client, spotlight) -> bool:
     name = spotlight.get("name")
     slug = name_to_slug(name)
@@ -232,89 +603,243 @@ async def spotlight_exists(client, spotlight) -> bool:
         return False
 
 
-async def remove_spotlight(client, spotlight):
-    name = spotlight.get("name")
-    slug = name_to_slug(name)
-    software_id = await slug_to_id(client, slug)
-    logging.info("Removing %s", name)
+def chunks(items, size=CHUNK_SIZE):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i : i + size]
 
-    if software_id is not None:
-        # remove related entries
-        res = (
-            await client.from_("maintainer_for_software")
-            .delete()
-            .eq("software", software_id)
-            .execute()
-        )
 
-        res = (
-            await client.from_("release")
-            .select("software")
-            .eq("software", software_id)
+async def delete_in(client, table, column, values):
+    """Delete all rows of a table whose column matches one of the values."""
+    await asyncio.gather(
+        *(
+            client.from_(table)
+            .delete(returning=ReturnMethod.minimal)
+            .in_(column, chunk)
             .execute()
+            for chunk in chunks(values)
         )
+    )
 
-        for rel in res.data:
-            res = (
-                await client.from_("release_version")
-                .delete()
-                .eq("release_id", rel.get("software"))
-                .execute()
+
+@PHASE_STATS.timed("remove")
+async def remove_spotlights(client, spotlights):
+    slugs = [name_to_slug(spotlight.get("name")) for spotlight in spotlights]
+    software_ids = [SOFTWARE_IDS[slug] for slug in slugs if slug in SOFTWARE_IDS]
+
+    if len(software_ids) == 0:
+        return
+
+    logging.info("Removing %d spotlights", len(software_ids))
+
+    async def remove_releases():
+        # release versions reference the release of the software
+        await delete_in(client, "release_version", "release_id", software_ids)
+        await delete_in(client, "release", "software", software_ids)
+
+    # remove related entries, which do not depend on each other
+    await asyncio.gather(
+        remove_releases(),
+        *(
+            delete_in(client, table, "software", software_ids)
+            for table in (
+                "maintainer_for_software",
+                "repository_url",
+                "license_for_software",
+                "contributor",
+                "keyword_for_software",
+                "software_for_organisation",
+                "software_highlight",
             )
+        ),
+    )
 
-        res = (
-            await client.from_("release").delete().eq("software", software_id).execute()
-        )
+    await delete_in(client, "software", "id", software_ids)
 
-        res = (
-            await client.from_("repository_url")
-            .delete()
-            .eq("software", software_id)
-            .execute()
-        )
+    for slug in slugs:
+        SOFTWARE_IDS.pop(slug, None)
 
-        res = (
-            await client.from_("license_for_software")
-            .delete()
-            .eq("software", software_id)
-            .execute()
-        )
+    logging.info("Removed %d spotlights", len(software_ids))
 
-        res = (
-            await client.from_("contributor")
-            .delete()
-            .eq("software", software_id)
-            .execute()
-        )
 
-        res = (
-            await client.from_("keyword_for_software")
-            .delete()
+def get_spotlight_organisations(spotlight):
+    orgs = spotlight.get("hgf_centers")
+    if isinstance(orgs, str):
+        orgs = [orgs]
+    return orgs or []
+
+
+def get_spotlight_keywords(spotlight):
+    """Return the keywords of a spotlight including its research field."""
+    keywords = list(spotlight.get("keywords") or [])
+    research_field = spotlight.get("hgf_research_field")
+    if research_field is not None and len(research_field) > 0:
+        keywords.append(research_field)
+    return keywords
+
+
+async def get_current_state(client, software_id, columns):
+    """Fetch the software entry and its related entries from the RSD."""
+    software, repository, licenses, keywords, orgs = await asyncio.gather(
+        client.from_("software").select(*columns).eq("id", software_id).execute(),
+        client.from_("repository_url")
+        .select("code_platform", "url")
+        .eq("software", software_id)
+        .execute(),
+        client.from_("license_for_software")
+        .select("id", "license")
+        .eq("software", software_id)
+        .execute(),
+        client.from_("keyword_for_software")
+        .select("keyword")
+        .eq("software", software_id)
+        .execute(),
+        client.from_("software_for_organisation")
+        .select("organisation")
+        .eq("software", software_id)
+        .execute(),
+    )
+    return {
+        "software": software.data[0],
+        "repository_url": repository.data[0] if len(repository.data) > 0 else None,
+        "licenses": {row["license"]: row["id"] for row in licenses.data},
+        "keywords": {row["keyword"] for row in keywords.data},
+        "organisations": {row["organisation"] for row in orgs.data},
+    }
+
+
+async def sync_links(client, table, column, software_id, current, desired):
+    """Add and remove rows of a link table so that it matches the desired ids."""
+    to_delete = current - set(desired)
+    to_insert = [value for value in dict.fromkeys(desired) if value not in current]
+    requests = []
+
+    if len(to_delete) > 0:
+        requests.append(
+            client.from_(table)
+            .delete(returning=ReturnMethod.minimal)
             .eq("software", software_id)
+            .in_(column, to_delete)
             .execute()
         )
-
-        res = (
-            await client.from_("software_for_organisation")
-            .delete()
-            .eq("software", software_id)
+    if len(to_insert) > 0:
+        requests.append(
+            client.from_(table)
+            .insert(
+                [{"software": software_id, column: value} for value in to_insert],
+                returning=ReturnMethod.minimal,
+            )
             .execute()
         )
 
-        res = (
-            await client.from_("software_highlight")
-            .delete()
-            .eq("software", software_id)
+    await asyncio.gather(*requests)
+    return len(requests) > 0
+
+
+@PHASE_STATS.timed("sync")
+async def sync_spotlight(client, spotlight, software_id):
+    """
+    Update an existing spotlight in place.
+
+    Only the fields and related entries which differ from the spotlight are
+    changed. Returns whether anything had to be changed.
+    """
+    name = spotlight.get("name")
+    repository, _ = get_spotlight_urls(spotlight)
+    slicense = spotlight.get("license")
+    sw_data = get_software_data(spotlight)
+
+    kw_ids = await get_or_create_keywords(client, get_spotlight_keywords(spotlight))
+    org_ids = [
+        await get_or_create_organisation(client, org)
+        for org in get_spotlight_organisations(spotlight)
+    ]
+    current = await get_current_state(client, software_id, sw_data.keys())
+
+    requests = []
+
+    changes = {
+        key: value
+        for key, value in sw_data.items()
+        if current["software"].get(key) != value
+    }
+    if len(changes) > 0:
+        logging.info("Update %s of %s", ", ".join(changes), name)
+        requests.append(
+            client.from_("software")
+            .update(changes, returning=ReturnMethod.minimal)
+            .eq("id", software_id)
             .execute()
         )
 
-    logging.info("Remove %s", name)
+    if current["repository_url"] != repository:
+        logging.info("Update repository URL of %s", name)
+        if repository is None:
+            query = (
+                client.from_("repository_url")
+                .delete(returning=ReturnMethod.minimal)
+                .eq("software", software_id)
+            )
+        elif current["repository_url"] is None:
+            query = client.from_("repository_url").insert(
+                {"software": software_id, **repository},
+                returning=ReturnMethod.minimal,
+            )
+        else:
+            query = (
+                client.from_("repository_url")
+                .update(repository, returning=ReturnMethod.minimal)
+                .eq("software", software_id)
+            )
+        requests.append(query.execute())
+
+    licenses = [slicense] if slicense is not None and len(slicense) > 0 else []
+    if set(current["licenses"]) != set(licenses):
+        logging.info("Update license of %s", name)
+        to_delete = [
+            lic_id for lic, lic_id in current["licenses"].items() if lic not in licenses
+        ]
+        if len(to_delete) > 0:
+            requests.append(
+                client.from_("license_for_software")
+                .delete(returning=ReturnMethod.minimal)
+                .in_("id", to_delete)
+                .execute()
+            )
+        if len(licenses) > 0 and licenses[0] not in current["licenses"]:
+            requests.append(
+                client.from_("license_for_software")
+                .insert(
+                    {"software": software_id, "license": slicense},
+                    returning=ReturnMethod.minimal,
+                )
+                .execute()
+            )
 
-    res = await client.from_("software").delete().eq("slug", slug).execute()
+    changed = await asyncio.gather(
+        sync_links(
+            client,
+            "keyword_for_software",
+            "keyword",
+            software_id,
+            current["keywords"],
+            kw_ids,
+        ),
+        sync_links(
+            client,
+            "software_for_organisation",
+            "organisation",
+            software_id,
+            current["organisations"],
+            org_ids,
+        ),
+        *requests,
+    )
 
-    logging.info(res.data)
+    return any(changed[:2]) or len(requests) > 0
 
 
+@PHASE_STATS.timed("add")
 async def add_spotlight(client, spotlight):
     name = spotlight.get("name")
 
@@ -322,30 +847,23 @@ async def add_spotlight(client, spotlight):
 
     sw_data = convert_spotlight_to_software(spotlight)
 
-    logging.info(sw_data)
-
     res = await client.from_("software").insert(sw_data).execute()
 
-    logging.info(res.data)
+    # PostgREST returns the inserted row, no need to look up the id again
+    software_id = res.data[0].get("id")
+    SOFTWARE_IDS[sw_data["slug"]] = software_id
+    logging.info("Added %s with id %s", name, software_id)
+    return software_id
 
 
-async def add_spotlight_urls(client, spotlight):
-    name = spotlight.get("name")
-    slug = name_to_slug(name)
-
-    platforms = spotlight.get("platforms", [])
-
-    if len(platforms) == 0:
-        logging.info("Spotlight %s has no platforms", name)
-        return
-
+def get_spotlight_urls(spotlight):
+    """Return the repository URL and the get started URL of a spotlight."""
     found_github = None
     found_gitlab = None
     found_webpage = None
-    to_add = None
-    to_update = None
+    repository = None
 
-    for plat in platforms:
+    for plat in spotlight.get("platforms", []):
         ptype = plat.get("type")
 
         if ptype == "gitlab":
@@ -355,43 +873,56 @@ async def add_spotlight_urls(client, spotlight):
         if ptype == "webpage":
             found_webpage = plat.get("link_as")
 
-    software_id = await slug_to_id(client, slug)
-
     # first check for GitLab as we prefer it over GitHub and only one entry
     # can be made in the RSD
     if found_gitlab is not None:
-        to_add = {
-            "software": software_id,
+        repository = {
             "code_platform": "gitlab",
             "url": found_gitlab,
         }
     elif found_github is not None:
-        to_add = {
-            "software": software_id,
+        repository = {
             "code_platform": "github",
             "url": found_github,
         }
 
-    if to_add is not None:
-        logging.info("Add repository URL for %s", name)
-        res = await client.from_("repository_url").insert(to_add).execute()
-        logging.info(res.data)
+    return repository, found_webpage
+
+
+async def add_repository_url(client, spotlight, software_id, repository):
+    logging.info("Add repository URL for %s", spotlight.get("name"))
+    await client.from_("repository_url").insert(
+        {"software": software_id, **repository}, returning=ReturnMethod.minimal
+    ).execute()
+
+
+@PHASE_STATS.timed("urls")
+async def add_spotlight_urls(client, spotlight, software_id):
+    name = spotlight.get("name")
+
+    platforms = spotlight.get("platforms", [])
+
+    if len(platforms) == 0:
+        logging.info("Spotlight %s has no platforms", name)
+        return
+
+    repository, found_webpage = get_spotlight_urls(spotlight)
+
+    if repository is not None:
+        await add_repository_url(client, spotlight, software_id, repository)
 
     if found_webpage is not None:
         to_update = {
             "get_started_url": found_webpage,
         }
         logging.info("Add get started URL for %s", name)
-        res = (
-            await client.from_("software")
-            .update(to_update)
-            .eq("id", software_id)
-            .execute()
-        )
-        logging.info(res.data)
+        await client.from_("software").update(
+            to_update, returning=ReturnMethod.minimal
+        ).eq("id", software_id).execute()
 
 
-async def add_license(client, spotlight):
+@PHASE_STATS.timed("license")
+async def add_license(client, spotlight, software_id):
     slicense = spotlight.get("license")
 
     if slicense is None or len(slicense) == 0:
@@ -399,35 +930,65 @@ async def add_license(client, spotlight):
         return
 
     name = spotlight.get("name")
-    slug = name_to_slug(name)
-    software_id = await slug_to_id(client, slug)
 
     logging.info("Add license for %s", name)
 
-    res = (
-        await client.from_("license_for_software")
-        .insert({"software": software_id, "license": slicense})
-        .execute()
-    )
+    await client.from_("license_for_software").insert(
+        {"software": software_id, "license": slicense},
+        returning=ReturnMethod.minimal,
+    ).execute()
 
-    logging.info(res.data)
 
+async def load_keyword_ids(client):
+    rows = await select_all(client, "keyword", "id", "value")
+    KEYWORD_IDS.update({row["value"].lower(): row["id"] for row in rows})
+    logging.info("Found %d existing keywords", len(rows))
 
-async def get_id_for_keyword(client, keyword):
-    res = (
-        await client.from_("keyword")
-        .select("id", "value")
-        .eq("value", keyword)
-        .execute()
-    )
 
-    if len(res.data) > 0:
-        return res.data[0].get("id")
+async def get_or_create_keywords(client, keywords):
+    """Return the ids of the given keywords, creating missing ones in one batch."""
+    async with KEYWORD_LOCK:
+        missing = {
+            keyword.lower(): keyword
+            for keyword in keywords
+            if keyword.lower() not in KEYWORD_IDS
+        }
 
-    return None
+        if len(missing) > 0:
+            logging.info("Adding keywords %s" % ", ".join(missing.values()))
+
+            res = (
+                await client.from_("keyword")
+                .upsert(
+                    [{"value": keyword} for keyword in missing.values()],
+                    on_conflict="value",
+                    ignore_duplicates=True,
+                )
+                .execute()
+            )
+
+            for row in res.data:
+                KEYWORD_IDS[row["value"].lower()] = row["id"]
+
+            # keywords that were added in the meantime are not returned
+            remaining = [
+                keyword for key, keyword in missing.items() if key not in KEYWORD_IDS
+            ]
+            if len(remaining) > 0:
+                res = (
+                    await client.from_("keyword")
+                    .select("id", "value")
+                    .in_("value", remaining)
+                    .execute()
+                )
+                for row in res.data:
+                    KEYWORD_IDS[row["value"].lower()] = row["id"]
 
+    return [KEYWORD_IDS[keyword.lower()] for keyword in keywords]
 
-async def add_keywords(client, spotlight):
+
+@PHASE_STATS.timed("keywords")
+async def add_keywords(client, spotlight, software_id):
     keywords = spotlight.get("keywords")
 
     if keywords is None or len(keywords) == 0:
@@ -435,94 +996,127 @@ async def add_keywords(client, spotlight):
         return
 
     name = spotlight.get("name")
-    slug = name_to_slug(name)
-    software_id = await slug_to_id(client, slug)
 
     logging.info("Add keywords for %s", name)
 
-    for keyword in keywords:
-        kw_id = await get_id_for_keyword(client, keyword)
+    kw_ids = await get_or_create_keywords(client, keywords)
 
-        if kw_id is None:
-            logging.info("Adding keyword %s" % keyword)
+    await client.from_("keyword_for_software").insert(
+        [
+            {"software": software_id, "keyword": kw_id}
+            for kw_id in dict.fromkeys(kw_ids)
+        ],
+        returning=ReturnMethod.minimal,
+    ).execute()
 
-            res = await client.from_("keyword").insert({"value": keyword}).execute()
-
-            logging.info(res.data)
-
-            kw_id = await get_id_for_keyword(client, keyword)
-
-        res = (
-            await client.from_("keyword_for_software")
-            .insert({"software": software_id, "keyword": kw_id})
-            .execute()
-        )
-
-        logging.info(res.data)
 
+async def load_organisations(client):
+    names = {
+        f"https://ror.org/{org['ror']}": name for name, org in ORGANISATIONS.items()
+    }
 
-async def get_id_for_organisation(client, org):
     res = (
         await client.from_("organisation")
-        .select("id", "name")
-        .eq("name", org)
+        .select("id", "ror_id", "logo_id")
+        .in_("ror_id", names.keys())
         .execute()
     )
 
-    if len(res.data) > 0:
-        return res.data[0].get("id")
-
-    return None
+    for row in res.data:
+        ORGANISATION_REGISTRY[names[row["ror_id"]]] = row
+    logging.info("Found %d of %d organisations", len(res.data), len(names))
+
+
+def read_logo(filename):
+    """Read a logo file and prepare its image entry."""
+    with open(os.path.join(LOGOS_DIR, filename), "rb") as logo:
+        content = logo.read()
+    data = base64.b64encode(content).decode("utf-8")
+    return {
+        "image": {"data": data, "mime_type": mime.from_buffer(content)},
+        # the insert trigger of the RSD sets the id of an image to the SHA-1
+        # of its base64 data, encode(sha1(data::bytea), 'hex')
+        "hash": hashlib.sha1(data.encode("utf-8")).hexdigest(),
+        "id": None,
+    }
 
 
-async def get_organisation_id_by_ror(client, ror):
-    res = (
-        await client.from_("organisation")
-        .select("id", "ror_id")
-        .eq("ror_id", f"https://ror.org/{ror}")
-        .execute()
-    )
+async def find_logo_images(client, files):
+    """Look up the image ids of logos whose content exists in the RSD."""
+    hashes = {LOGOS[file]["hash"]: file for file in files}
+    for row in await select_in(client, "image", "id", list(hashes), "id"):
+        LOGOS[hashes[row["id"]]]["id"] = row["id"]
 
-    if len(res.data) > 0:
-        return res.data[0].get("id")
 
-    return None
+@PHASE_STATS.timed("logos")
+async def load_logos(client):
+    """
+    Prepare the logos of all organisations without a logo.
 
+    Every logo file is read and encoded once. Logos whose content exists in
+    the RSD already are reused, the missing ones are uploaded concurrently.
+    """
+    files = sorted(
+        {
+            org["logo"]
+            for name, org in ORGANISATIONS.items()
+            if "logo" in org
+            and ORGANISATION_REGISTRY.get(name, {}).get("logo_id") is None
+        }
+    )
+    if len(files) == 0:
+        return
 
-async def organisation_has_logo(client, org_id) -> bool:
-    res = (
-        await client.from_("organisation")
-        .select("id", "logo_id")
-        .eq("id", org_id)
-        .execute()
+    logos = await asyncio.gather(
+        *(asyncio.to_thread(read_logo, file) for file in files)
+    )
+    LOGOS.update(zip(files, logos))
+    await find_logo_images(client, files)
+
+    # upload files with the same content only once
+    missing = {LOGOS[file]["hash"]: file for file in files if LOGOS[file]["id"] is None}
+    if len(missing) > 0:
+        logging.info("Uploading logos %s", ", ".join(missing.values()))
+        results = await asyncio.gather(
+            *(
+                client.from_("image")
+                .insert(LOGOS[file]["image"], returning=ReturnMethod.minimal)
+                .execute()
+                for file in missing.values()
+            ),
+            return_exceptions=True,
+        )
+        # organisations are added without the logos which failed, they are
+        # uploaded again in the next run
+        for file, result in zip(missing.values(), results):
+            if isinstance(result, Exception):
+                logging.error("Could not upload logo %s: %s", file, result)
+        await find_logo_images(client, files)
+
+    logging.info(
+        "Prepared %d logos, %d of them were uploaded", len(files), len(missing)
     )
-    if len(res.data) == 1 and res.data[0]["logo_id"] is not None:
-        return True
-    else:
-        return False
 
 
-async def add_organisations(client, spotlight):
-    orgs = spotlight.get("hgf_centers")
-    if isinstance(orgs, str):
-        orgs = [orgs]
+async def add_logo(client, org, org_id):
+    logo_filename = ORGANISATIONS[org]["logo"]
+    logo_id = LOGOS.get(logo_filename, {}).get("id")
+    if logo_id is None:
+        logging.error("Logo %s of %s was not uploaded", logo_filename, org)
+        return None
 
-    if orgs is None or len(orgs) == 0:
-        # no organisation specified
-        return
+    await client.from_("organisation").update(
+        {"logo_id": logo_id}, returning=ReturnMethod.minimal
+    ).eq("id", org_id).execute()
+    logging.info("Added logo %s to organisation %s" % (logo_id, org_id))
+    return logo_id
 
-    name = spotlight.get("name")
-    slug = name_to_slug(name)
-    software_id = await slug_to_id(client, slug)
 
-    logging.info("Add organisations for %s", name)
+async def get_or_create_organisation(client, org):
+    async with ORGANISATION_LOCK:
+        entry = ORGANISATION_REGISTRY.get(org)
 
-    for org in orgs:
-        org_id = await get_organisation_id_by_ror(
-            client, ORGANISATIONS.get(org).get("ror")
-        )
-
-        if org_id is None:
+        if entry is None:
             logging.info("Adding organisation %s" % org)
 
             org_slug = org_name_to_slug(org)
@@ -530,58 +1124,52 @@ async def add_organisations(client, spotlight):
             if ror_id is None or ror_id == "https://ror.org/":
                 logging.warn("Could not find ROR Id for: %s" % org)
 
-            res_img = (
+            res_org = (
                 await client.from_("organisation")
                 .insert({"name": org, "slug": org_slug, "ror_id": ror_id})
                 .execute()
             )
 
-            logging.info(res_img.data)
+            entry = ORGANISATION_REGISTRY[org] = res_org.data[0]
 
-            org_id = await get_id_for_organisation(client, org)
+        if entry.get("logo_id") is None:
+            logo_available = "logo" in ORGANISATIONS.get(org).keys()
+            if not logo_available and org not in MISSING_LOGOS:
+                logging.warn("No logo found for %s" % org)
+                MISSING_LOGOS.append(org)
+            elif logo_available:
+                entry["logo_id"] = await add_logo(client, org, entry["id"])
 
-        logo_exists = await organisation_has_logo(client, org_id)
-        logo_available = (
-            org in ORGANISATIONS.keys() and "logo" in ORGANISATIONS.get(org).keys()
-        )
-        if not logo_exists and not logo_available:
-            logging.warn("No logo found for %s" % org)
-            MISSING_LOGOS.append(org)
-        elif not logo_exists:
-            logo_filename = f"./resources/logos/{ORGANISATIONS[org]['logo']}"
-            logging.info("Adding logo %s" % logo_filename)
-            with open(logo_filename, "rb") as logo:
-                logo_base64 = base64.b64encode(logo.read()).decode("utf-8")
-                mime_type = mime.from_file(logo_filename)
-                logo_data = {
-                    "data": logo_base64,
-                    "mime_type": mime_type,
-                }
-                res_img = await client.from_("image").insert(logo_data).execute()
-                logging.info(res_img.data)
-                logo_id = res_img.data[0]["id"]
-                logging.info("Uploaded logo %s" % logo_filename)
-            res_org = (
-                await client.from_("organisation")
-                .update({"logo_id": logo_id})
-                .eq("id", org_id)
-                .execute()
-            )
-            logging.info("Added logo %s to organisation %s" % (logo_id, org_id))
-            logging.info(res_org.data)
+    return entry["id"]
 
-        logging.info("Adding organisation %s to software %s" % (org, name))
 
-        res_img = (
-            await client.from_("software_for_organisation")
-            .insert({"software": software_id, "organisation": org_id})
-            .execute()
-        )
+@PHASE_STATS.timed("organisations")
+async def add_organisations(client, spotlight, software_id):
+    orgs = get_spotlight_organisations(spotlight)
 
-        logging.info(res_img.data)
+    if len(orgs) == 0:
+        # no organisation specified
+        return
+
+    name = spotlight.get("name")
+
+    logging.info("Add organisations for %s", name)
 
+    org_ids = [await get_or_create_organisation(client, org) for org in orgs]
 
-async def add_research_field(client, spotlight):
+    logging.info("Adding organisations %s to software %s" % (", ".join(orgs), name))
+
+    await client.from_("software_for_organisation").insert(
+        [
+            {"software": software_id, "organisation": org_id}
+            for org_id in dict.fromkeys(org_ids)
+        ],
+        returning=ReturnMethod.minimal,
+    ).execute()
+
+
+@PHASE_STATS.timed("research-field")
+async def add_research_field(client, spotlight, software_id):
     research_field = spotlight.get("hgf_research_field")
 
     if research_field is None or len(research_field) == 0:
@@ -589,58 +1177,128 @@ async def add_research_field(client, spotlight):
         return
 
     name = spotlight.get("name")
-    slug = name_to_slug(name)
-    software_id = await slug_to_id(client, slug)
 
     logging.info("Add research field for %s", name)
 
-    kw_id = await get_id_for_keyword(client, research_field)
+    [kw_id] = await get_or_create_keywords(client, [research_field])
 
-    if kw_id is None:
-        logging.info("Adding research field %s" % research_field)
+    await client.from_("keyword_for_software").insert(
+        {"software": software_id, "keyword": kw_id}, returning=ReturnMethod.minimal
+    ).execute()
 
-        res = await client.from_("keyword").insert({"value": research_field}).execute()
 
-        logging.info(res.data)
+async def insert_rows(client, table, rows, returning=ReturnMethod.minimal):
+    """Insert rows in chunks of BULK_CHUNK_SIZE and return the inserted rows."""
+    inserted = []
+    for chunk in chunks(rows, BULK_CHUNK_SIZE):
+        logging.info("Adding %d rows to %s", len(chunk), table)
+        res = await client.from_(table).insert(chunk, returning=returning).execute()
+        inserted.extend(res.data)
+    return inserted
 
-        kw_id = await get_id_for_keyword(client, research_field)
 
-    res = (
-        await client.from_("keyword_for_software")
-        .insert({"software": software_id, "keyword": kw_id})
-        .execute()
+@PHASE_STATS.timed("bulk-add")
+async def add_spotlights(client, spotlights):
+    """
+    Add new spotlights with array inserts instead of one request per row.
+
+    All software rows are inserted first, the rows of the other tables are
+    inserted afterwards with one array insert per table and chunk.
+    """
+    if len(spotlights) == 0:
+        return
+
+    logging.info("Add %d spotlights in bulk", len(spotlights))
+
+    rows = [get_software_data(spotlight) for spotlight in spotlights]
+    inserted = await insert_rows(
+        client, "software", rows, returning=ReturnMethod.representation
+    )
+    SOFTWARE_IDS.update({row["slug"]: row["id"] for row in inserted})
+
+    await get_or_create_keywords(
+        client,
+        list(
+            dict.fromkeys(
+                keyword
+                for spotlight in spotlights
+                for keyword in get_spotlight_keywords(spotlight)
+            )
+        ),
     )
+    org_ids = {}
+    for spotlight in spotlights:
+        for org in get_spotlight_organisations(spotlight):
+            if org not in org_ids:
+                org_ids[org] = await get_or_create_organisation(client, org)
+
+    repositories = []
+    licenses = []
+    keywords = []
+    organisations = []
+    for spotlight in spotlights:
+        software_id = SOFTWARE_IDS[name_to_slug(spotlight.get("name"))]
+
+        repository, _ = get_spotlight_urls(spotlight)
+        if repository is not None:
+            repositories.append({"software": software_id, **repository})
+
+        slicense = spotlight.get("license")
+        if slicense is not None and len(slicense) > 0:
+            licenses.append({"software": software_id, "license": slicense})
+
+        kw_ids = [
+            KEYWORD_IDS[keyword.lower()]
+            for keyword in get_spotlight_keywords(spotlight)
+        ]
+        keywords.extend(
+            {"software": software_id, "keyword": kw_id}
+            for kw_id in dict.fromkeys(kw_ids)
+        )
+
+        organisations.extend(
+            {"software": software_id, "organisation": org_id}
+            for org_id in dict.fromkeys(
+                org_ids[org] for org in get_spotlight_organisations(spotlight)
+            )
+        )
 
-    logging.info(res.data)
+    await asyncio.gather(
+        insert_rows(client, "repository_url", repositories),
+        insert_rows(client, "license_for_software", licenses),
+        insert_rows(client, "keyword_for_software", keywords),
+        insert_rows(client, "software_for_organisation", organisations),
+    )
 
 
 async def process_imprint(client):
     filename = "./resources/Imprint.md"
-    with open(filename, "r") as imprint:
-        logging.info("Processing imprint from %s", filename)
-
-        data = {
-            "slug": "imprint",
-            "title": "Imprint",
-            "description": imprint.read(),
-            "is_published": True,
-            "position": 1,
-        }
+    logging.info("Processing imprint from %s", filename)
+    imprint, _, error = await asyncio.to_thread(try_read_file, filename)
+    if error is not None:
+        raise OSError(error)
+
+    data = {
+        "slug": "imprint",
+        "title": "Imprint",
+        "description": imprint.decode("utf-8"),
+        "is_published": True,
+        "position": 1,
+    }
 
-        db_imprint = (
-            await client.from_("meta_pages").select("*").eq("slug", "imprint").execute()
-        )
+    db_imprint = (
+        await client.from_("meta_pages").select("*").eq("slug", "imprint").execute()
+    )
 
-        if len(db_imprint.data) > 0 and not UPDATE_IMPRINT:
-            logging.info("Imprint already exists, but will not be updated.")
-            return
-        elif len(db_imprint.data) > 0 and UPDATE_IMPRINT:
-            logging.info("Imprint already exsits. Updating.")
-            res = await client.from_("meta_pages").update(data).execute()
-        else:
-            logging.info("Imprint not found. Creating.")
-            res = await client.from_("meta_pages").insert(data).execute()
-        logging.info(res.data)
+    if len(db_imprint.data) > 0 and not UPDATE_IMPRINT:
+        logging.info("Imprint already exists, but will not be updated.")
+        return
+    elif len(db_imprint.data) > 0 and UPDATE_IMPRINT:
+        logging.info("Imprint already exsits. Updating.")
+        await client.from_("meta_pages").update(data).execute()
+    else:
+        logging.info("Imprint not found. Creating.")
+        await client.from_("meta_pages").insert(data).execute()
 
 
 def check_env():
@@ -656,39 +1314,768 @@ def check_env():
     logging.info("Runtime variables checked.")
 
 
+def spotlight_hash(spotlight):
+    data = json.dumps(spotlight, sort_keys=True, default=str)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def load_state():
+    if not os.path.exists(STATE_FILE):
+        logging.info("No state file %s found, all spotlights are checked", STATE_FILE)
+        return
+
+    with open(STATE_FILE, "r") as state:
+        SPOTLIGHT_HASHES.update(json.load(state))
+
+
+def save_state():
+    with open(STATE_FILE + ".tmp", "w") as state:
+        json.dump(SPOTLIGHT_HASHES, state, indent=2, sort_keys=True)
+    os.replace(STATE_FILE + ".tmp", STATE_FILE)
+    logging.info(
+        "Saved state of %d spotlights to %s", len(SPOTLIGHT_HASHES), STATE_FILE
+    )
+
+
+def load_journal():
+    """Return the steps recorded in JOURNAL_FILE, indexed by slug."""
+    entries = {}
+    if not os.path.exists(JOURNAL_FILE):
+        logging.warning("No journal %s found, nothing to resume", JOURNAL_FILE)
+        return entries
+
+    with open(JOURNAL_FILE, "r") as journal:
+        for line in journal:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # the last line is incomplete if the run was killed while writing it
+                continue
+            entry = entries.setdefault(record.pop("slug"), {"steps": []})
+            entry["steps"].append(record["step"])
+            entry.update(record)
+
+    return entries
+
+
+def open_journal():
+    """Start a new journal or, with RESUME, continue the interrupted one."""
+    global JOURNAL_STREAM
+
+    if RESUME:
+        JOURNAL.update(load_journal())
+        logging.info(
+            "Resuming a run with %d spotlights from %s", len(JOURNAL), JOURNAL_FILE
+        )
+    JOURNAL_STREAM = open(JOURNAL_FILE, "a" if RESUME else "w")
+
+
+def close_journal(complete):
+    """Close the journal, which is no longer needed once the run is complete."""
+    global JOURNAL_STREAM
+
+    JOURNAL_STREAM.close()
+    JOURNAL_STREAM = None
+    if complete:
+        os.remove(JOURNAL_FILE)
+
+
+def write_journal(slug, step, **data):
+    """
+    Record that a step of the migration of a spotlight is completed.
+
+    The steps are "start" before anything is written, the add_* steps of a new
+    spotlight and "done" together with its status and content hash.
+    """
+    if JOURNAL_STREAM is None:
+        return
+
+    JOURNAL_STREAM.write(json.dumps({"slug": slug, "step": step, **data}) + "\n")
+    # the entry must survive if the process is killed right afterwards
+    JOURNAL_STREAM.flush()
+
+
+def check_spotlight(spotlight):
+    """Return the reason why a spotlight cannot be migrated, if any."""
+    if len(spotlight.get("description", "")) > 10000:
+        return "Description too long."
+    return None
+
+
+@PHASE_STATS.timed("rpc")
+async def call_migrate_spotlight(client, spotlight):
+    """
+    Create or update a spotlight with a single call of the SQL function.
+
+    Returns whether the spotlight was created and whether anything changed.
+    """
+    name = spotlight.get("name")
+    repository, _ = get_spotlight_urls(spotlight)
+    slicense = spotlight.get("license")
+
+    # organisations are shared and come with a logo, so they are created first
+    org_ids = [
+        await get_or_create_organisation(client, org)
+        for org in get_spotlight_organisations(spotlight)
+    ]
+
+    payload = {
+        "software": get_software_data(spotlight),
+        "repository_url": repository,
+        "licenses": [slicense] if slicense is not None and len(slicense) > 0 else [],
+        "keywords": get_spotlight_keywords(spotlight),
+        "organisations": org_ids,
+    }
+
+    logging.info("Migrate %s", name)
+    res = await (await client.rpc("migrate_spotlight", {"payload": payload})).execute()
+
+    [result] = res.data
+    SOFTWARE_IDS[payload["software"]["slug"]] = result["software_id"]
+    return result["created"], result["changed"]
+
+
+async def migrate_spotlight(client, spotlight):
+    """Migrate a single spotlight and return its status for the final report."""
+    # check if spotlight matches our criteria
+    error = check_spotlight(spotlight)
+    if error is not None:
+        return "error", error
+
+    slug = name_to_slug(spotlight.get("name"))
+    content_hash = spotlight_hash(spotlight)
+    entry = JOURNAL.get(slug)
+    if entry is not None and entry["step"] == "done" and entry["hash"] == content_hash:
+        # migrated before the previous run was interrupted
+        return entry["status"], None
+
+    software_id = await slug_to_id(client, slug)
+
+    # existing spotlights have already been removed if they are to be replaced
+    if software_id is not None:
+        # spotlights whose migration was interrupted are completed in any case
+        interrupted = entry is not None and entry["step"] != "done"
+        if not interrupted and not UPDATE_SPOTLIGHTS and not INCREMENTAL:
+            return "exists", None
+
+        if (
+            not interrupted
+            and INCREMENTAL
+            and SPOTLIGHT_HASHES.get(slug) == content_hash
+        ):
+            return "exists", None
+
+        new = interrupted and entry["new"]
+        write_journal(slug, "start", new=new)
+        if RPC:
+            _, changed = await call_migrate_spotlight(client, spotlight)
+        else:
+            changed = await sync_spotlight(client, spotlight, software_id)
+        if INCREMENTAL:
+            SPOTLIGHT_HASHES[slug] = content_hash
+        status = "created" if new else "updated" if changed else "exists"
+        write_journal(slug, "done", status=status, hash=content_hash)
+        return status, None
+
+    write_journal(slug, "start", new=True)
+    if RPC:
+        await call_migrate_spotlight(client, spotlight)
+    else:
+        software_id = await add_spotlight(client, spotlight)
+        write_journal(slug, "add", software_id=software_id)
+        for step, add in (
+            ("urls", add_spotlight_urls),
+            ("license", add_license),
+            ("keywords", add_keywords),
+            ("research-field", add_research_field),
+            ("organisations", add_organisations),
+        ):
+            await add(client, spotlight, software_id)
+            write_journal(slug, step)
+    if INCREMENTAL:
+        SPOTLIGHT_HASHES[slug] = content_hash
+    write_journal(slug, "done", status="created", hash=content_hash)
+    return "created", None
+
+
+async def migrate_spotlights(client, spotlights):
+    """
+    Migrate the spotlights of an iterator of parse results.
+
+    The iterator is consumed in a separate thread while CONCURRENCY workers
+    migrate the spotlights that are ready. Returns the status of every
+    spotlight together with its name, in the order of the iterator.
+    """
+    queue = asyncio.Queue(maxsize=2 * CONCURRENCY)
+    results = {}
+
+    async def produce():
+        async for item in iterate_in_thread(enumerate(spotlights)):
+            await queue.put(item)
+        for _ in range(CONCURRENCY):
+            await queue.put(None)
+
+    async def consume():
+        while (item := await queue.get()) is not None:
+            index, (file, spot, error) = item
+            if error is not None:
+                results[index] = (file, "error", error)
+                continue
+
+            try:
+                status, reason = await migrate_spotlight(client, spot)
+            except (APIError, httpx.TransportError) as exc:
+                # requests have been retried already, give up on this spotlight
+                logging.error("Could not migrate %s: %s", spot.get("name"), exc)
+                status, reason = "error", "%s: %s" % (type(exc).__name__, exc)
+            results[index] = (spot.get("name"), status, reason)
+
+    async with asyncio.TaskGroup() as group:
+        group.create_task(produce())
+        for _ in range(CONCURRENCY):
+            group.create_task(consume())
+
+    return [results[index] for index in sorted(results)]
+
+
+async def migrate_spotlights_bulk(client, spotlights):
+    """
+    Migrate the spotlights of an iterator of parse results in bulk.
+
+    All new spotlights are added with add_spotlights, the remaining ones are
+    migrated one by one by migrate_spotlights. If the bulk insert fails, the
+    new spotlights are migrated one by one as well, completing those which
+    were partly added. Returns the same results as migrate_spotlights.
+    """
+    results = []
+    new = {}
+    others = []
+
+    async for file, spot, error in iterate_in_thread(spotlights):
+        if error is not None:
+            results.append((file, "error", error))
+            continue
+
+        slug = name_to_slug(spot.get("name"))
+        if (
+            check_spotlight(spot) is None
+            and slug not in new
+            and await slug_to_id(client, slug) is None
+        ):
+            new[slug] = (len(results), spot)
+        else:
+            # existing spotlights, duplicates and errors are handled as usual
+            others.append((len(results), spot))
+        results.append(None)
+
+    for slug in new:
+        write_journal(slug, "start", new=True)
+    try:
+        await add_spotlights(client, [spot for _, spot in new.values()])
+    except (APIError, httpx.TransportError) as exc:
+        logging.error("Could not add the spotlights in bulk, retry one by one: %s", exc)
+        # find the software entries added before the error, even if the
+        # response to their insert got lost
+        rows = await select_in(client, "software", "slug", list(new), "id", "slug")
+        SOFTWARE_IDS.update({row["slug"]: row["id"] for row in rows})
+        for slug in new:
+            # complete them like the spotlights of an interrupted run
+            JOURNAL[slug] = {"steps": ["start"], "step": "start", "new": True}
+        others.extend(new.values())
+    else:
+        for slug, (index, spot) in new.items():
+            content_hash = spotlight_hash(spot)
+            if INCREMENTAL:
+                SPOTLIGHT_HASHES[slug] = content_hash
+            write_journal(slug, "done", status="created", hash=content_hash)
+            results[index] = (spot.get("name"), "created", None)
+
+    migrated = await migrate_spotlights(
+        client, ((None, spot, None) for _, spot in others)
+    )
+    for (index, _), result in zip(others, migrated):
+        results[index] = result
+
+    return results
+
+
+async def get_snapshot(client, software_ids):
+    """
+    Fetch the software entries with the given ids and their related entries.
+
+    The entries of all software are fetched together and returned indexed by
+    software id, with keywords given by value and organisations as a mapping
+    of their id to their name. Known organisations are named as in
+    ORGANISATIONS, whatever their name in the RSD.
+    """
+    software, repositories, licenses, keywords, orgs = await asyncio.gather(
+        select_in(client, "software", "id", software_ids, "*"),
+        select_in(
+            client,
+            "repository_url",
+            "software",
+            software_ids,
+            "software",
+            "code_platform",
+            "url",
+        ),
+        select_in(
+            client,
+            "license_for_software",
+            "software",
+            software_ids,
+            "software",
+            "license",
+        ),
+        select_in(
+            client,
+            "keyword_for_software",
+            "software",
+            software_ids,
+            "software",
+            "keyword",
+        ),
+        select_in(
+            client,
+            "software_for_organisation",
+            "software",
+            software_ids,
+            "software",
+            "organisation",
+        ),
+    )
+    keyword_values = {kw_id: value for value, kw_id in KEYWORD_IDS.items()}
+    org_names = {entry["id"]: name for name, entry in ORGANISATION_REGISTRY.items()}
+    # organisations linked to the software but not known to this script
+    org_rows = await select_in(
+        client,
+        "organisation",
+        "id",
+        list({row["organisation"] for row in orgs} - org_names.keys()),
+        "id",
+        "name",
+    )
+    org_names.update({row["id"]: row["name"] for row in org_rows})
+
+    snapshot = {
+        row["id"]: {
+            "software": row,
+            "repository_url": None,
+            "licenses": set(),
+            "keywords": set(),
+            "organisations": {},
+        }
+        for row in software
+    }
+    for row in repositories:
+        snapshot[row.pop("software")]["repository_url"] = row
+    for row in licenses:
+        snapshot[row["software"]]["licenses"].add(row["license"])
+    for row in keywords:
+        snapshot[row["software"]]["keywords"].add(keyword_values[row["keyword"]])
+    for row in orgs:
+        snapshot[row["software"]]["organisations"][row["organisation"]] = org_names[
+            row["organisation"]
+        ]
+    return snapshot
+
+
+def plan_spotlight(spotlight, current):
+    """
+    Return the changes to migrate a spotlight as (table, operation, entry).
+
+    current is the state of the spotlight in the RSD as returned by
+    get_snapshot, or None if the spotlight does not exist yet. Entries refer
+    to software by slug, to keywords by value and to organisations by name,
+    as new entries do not have an id yet. Organisations are compared by id,
+    which links to be removed carry as well.
+    """
+    slug = name_to_slug(spotlight.get("name"))
+    software = get_software_data(spotlight)
+    repository, _ = get_spotlight_urls(spotlight)
+    slicense = spotlight.get("license")
+    # values indexed by how they are compared with the RSD
+    licenses = (
+        {slicense: slicense} if slicense is not None and len(slicense) > 0 else {}
+    )
+    keywords = {
+        keyword.lower(): keyword for keyword in get_spotlight_keywords(spotlight)
+    }
+    # by id, or by name if the organisation does not exist yet
+    orgs = {
+        ORGANISATION_REGISTRY.get(org, {}).get("id", org): org
+        for org in get_spotlight_organisations(spotlight)
+    }
+    changes = []
+
+    if current is None:
+        changes.append(("software", "insert", software))
+        current = {
+            "repository_url": None,
+            "licenses": set(),
+            "keywords": set(),
+            "organisations": {},
+        }
+    else:
+        updates = {
+            key: value
+            for key, value in software.items()
+            if current["software"].get(key) != value
+        }
+        if len(updates) > 0:
+            changes.append(("software", "update", {"slug": slug, "changes": updates}))
+
+    if current["repository_url"] != repository:
+        if repository is None:
+            changes.append(("repository_url", "delete", {"software": slug}))
+        elif current["repository_url"] is None:
+            changes.append(
+                ("repository_url", "insert", {"software": slug, **repository})
+            )
+        else:
+            changes.append(
+                ("repository_url", "update", {"software": slug, **repository})
+            )
+
+    for table, column, current_values, values in (
+        ("license_for_software", "license", current["licenses"], licenses),
+        ("keyword_for_software", "keyword", current["keywords"], keywords),
+    ):
+        changes.extend(
+            (table, "delete", {"software": slug, column: value})
+            for value in sorted(current_values)
+            if value not in values
+        )
+        changes.extend(
+            (table, "insert", {"software": slug, column: values[key]})
+            for key in values
+            if key not in current_values
+        )
+
+    changes.extend(
+        (
+            "software_for_organisation",
+            "delete",
+            {"software": slug, "organisation": name, "id": org_id},
+        )
+        for org_id, name in sorted(
+            current["organisations"].items(), key=lambda item: item[1]
+        )
+        if org_id not in orgs
+    )
+    changes.extend(
+        (
+            "software_for_organisation",
+            "insert",
+            {"software": slug, "organisation": name},
+        )
+        for key, name in orgs.items()
+        if key not in current["organisations"]
+    )
+
+    return changes
+
+
+async def plan_spotlights(client, spotlights):
+    """
+    Compute all changes to migrate the spotlights of an iterator of parse results.
+
+    The current state of the existing spotlights is fetched in bulk and
+    nothing is written to the RSD. Existing spotlights are only compared if
+    UPDATE_SPOTLIGHTS is set.
+    """
+    plan = {
+        "version": PLAN_VERSION,
+        "changes": {table: {} for table in PLAN_TABLES},
+        "created": [],
+        "updated": [],
+        "exists": [],
+        "errors": [],
+    }
+    new = {}
+    existing = {}
+
+    async for file, spot, error in iterate_in_thread(spotlights):
+        if error is None:
+            error = check_spotlight(spot)
+        if error is not None:
+            plan["errors"].append([file if spot is None else spot.get("name"), error])
+            continue
+
+        slug = name_to_slug(spot.get("name"))
+        if slug in new or slug in existing:
+            plan["exists"].append(spot.get("name"))
+        elif slug not in SOFTWARE_IDS:
+            new[slug] = spot
+        elif UPDATE_SPOTLIGHTS:
+            existing[slug] = spot
+        else:
+            plan["exists"].append(spot.get("name"))
+
+    snapshot = await get_snapshot(client, [SOFTWARE_IDS[slug] for slug in existing])
+
+    changes = []
+    for slug, spot in new.items():
+        changes.extend(plan_spotlight(spot, None))
+        plan["created"].append(spot.get("name"))
+    for slug, spot in existing.items():
+        spot_changes = plan_spotlight(spot, snapshot[SOFTWARE_IDS[slug]])
+        changes.extend(spot_changes)
+        plan["updated" if len(spot_changes) > 0 else "exists"].append(spot.get("name"))
+
+    # keywords and organisations which do not exist yet
+    new_keywords = {}
+    new_orgs = {}
+    for table, operation, entry in changes:
+        if operation != "insert":
+            continue
+        if table == "keyword_for_software":
+            if entry["keyword"].lower() not in KEYWORD_IDS:
+                new_keywords.setdefault(entry["keyword"].lower(), entry["keyword"])
+        elif table == "software_for_organisation":
+            if entry["organisation"] not in ORGANISATION_REGISTRY:
+                new_orgs.setdefault(entry["organisation"])
+    changes.extend(("keyword", "insert", value) for value in new_keywords.values())
+    changes.extend(("organisation", "insert", name) for name in new_orgs)
+
+    for table, operation, entry in changes:
+        plan["changes"][table].setdefault(operation, []).append(entry)
+
+    return plan
+
+
+async def apply_plan(client, plan):
+    """
+    Write the changes of a plan created by plan_spotlights to the RSD.
+
+    Software, keywords and organisations are resolved again, so a plan can
+    be applied after new software or keywords were added in the meantime.
+    """
+    if plan.get("version") != PLAN_VERSION:
+        raise RuntimeError("Unsupported plan version %s" % plan.get("version"))
+
+    changes = plan["changes"]
+
+    def entries(table, operation):
+        return changes.get(table, {}).get(operation, [])
+
+    def software_id(slug):
+        if slug not in SOFTWARE_IDS:
+            raise RuntimeError("Software %s of the plan does not exist" % slug)
+        return SOFTWARE_IDS[slug]
+
+    await get_or_create_keywords(
+        client,
+        list(
+            dict.fromkeys(
+                entries("keyword", "insert")
+                + [
+                    entry["keyword"]
+                    for entry in entries("keyword_for_software", "insert")
+                ]
+            )
+        ),
+    )
+    org_ids = {}
+    for name in entries("organisation", "insert") + [
+        entry["organisation"]
+        for entry in entries("software_for_organisation", "insert")
+    ]:
+        if name not in org_ids:
+            org_ids[name] = await get_or_create_organisation(client, name)
+
+    inserted = await insert_rows(
+        client,
+        "software",
+        entries("software", "insert"),
+        returning=ReturnMethod.representation,
+    )
+    SOFTWARE_IDS.update({row["slug"]: row["id"] for row in inserted})
+
+    def unlink(table, column, value_id):
+        """Delete the link rows of every software in one request."""
+        by_software = {}
+        for entry in entries(table, "delete"):
+            by_software.setdefault(entry["software"], []).append(value_id(entry))
+        return [
+            client.from_(table)
+            .delete(returning=ReturnMethod.minimal)
+            .eq("software", software_id(slug))
+            .in_(column, ids)
+            .execute()
+            for slug, ids in by_software.items()
+        ]
+
+    await asyncio.gather(
+        *(
+            client.from_("software")
+            .update(entry["changes"], returning=ReturnMethod.minimal)
+            .eq("id", software_id(entry["slug"]))
+            .execute()
+            for entry in entries("software", "update")
+        ),
+        *(
+            client.from_("repository_url")
+            .update(
+                {key: value for key, value in entry.items() if key != "software"},
+                returning=ReturnMethod.minimal,
+            )
+            .eq("software", software_id(entry["software"]))
+            .execute()
+            for entry in entries("repository_url", "update")
+        ),
+        delete_in(
+            client,
+            "repository_url",
+            "software",
+            [
+                software_id(entry["software"])
+                for entry in entries("repository_url", "delete")
+            ],
+        ),
+        *unlink("license_for_software", "license", lambda entry: entry["license"]),
+        *unlink(
+            "keyword_for_software",
+            "keyword",
+            lambda entry: KEYWORD_IDS[entry["keyword"].lower()],
+        ),
+        *unlink("software_for_organisation", "organisation", lambda entry: entry["id"]),
+    )
+
+    def link(table, column=None, value_id=None):
+        """Return the rows to insert with the ids of the referenced entries."""
+        rows = []
+        for entry in entries(table, "insert"):
+            row = {**entry, "software": software_id(entry["software"])}
+            if column is not None:
+                row[column] = value_id(entry[column])
+            rows.append(row)
+        return rows
+
+    await asyncio.gather(
+        insert_rows(client, "repository_url", link("repository_url")),
+        insert_rows(client, "license_for_software", link("license_for_software")),
+        insert_rows(
+            client,
+            "keyword_for_software",
+            link(
+                "keyword_for_software",
+                "keyword",
+                lambda value: KEYWORD_IDS[value.lower()],
+            ),
+        ),
+        insert_rows(
+            client,
+            "software_for_organisation",
+            link("software_for_organisation", "organisation", org_ids.get),
+        ),
+    )
+
+
+def print_plan(plan):
+    """Print the number of changes of a plan per table and operation."""
+    for table in PLAN_TABLES:
+        for operation, entries in plan["changes"].get(table, {}).items():
+            print("  %s %d %s" % (operation, len(entries), table))
+
+
 async def main():
     check_env()
     token = jwt.encode(JWT_PAYLOAD, PGRST_JWT_SECRET, algorithm=JWT_ALGORITHM)
-    spotlights = get_spotlights()
     created_spotlights = []
-    skipped_errors = []
+    updated_spotlights = []
     skipped_no_update = []
+    skipped_errors = []
 
-    async with AsyncPostgrestClient(POSTGREST_URL) as client:
+    async with RetryingPostgrestClient(
+        POSTGREST_URL,
+        retries=RETRIES,
+        timeout=TIMEOUT,
+        max_connections=MAX_CONNECTIONS,
+        stats=REQUEST_STATS,
+    ) as client:
         client.auth(token=token)
         # await process_imprint(client)
+        await asyncio.gather(
+            load_software_ids(client),
+            load_keyword_ids(client),
+            load_organisations(client),
+        )
 
-        for spot in spotlights:
-            # check if spotlight matches our criteria
-            if len(spot.get("description", "")) > 10000:
-                skipped_errors.append([spot.get("name"), "Description too long."])
-                continue
+        if PLAN_FILE is None:
+            # logos are needed as soon as an organisation is added
+            await load_logos(client)
 
-            already_exists = await spotlight_exists(client, spot)
-            if already_exists and DELETE_SPOTLIGHTS:
-                # update existing -> remove first
-                await remove_spotlight(client, spot)
-            elif already_exists and not DELETE_SPOTLIGHTS:
-                skipped_no_update.append(spot.get("name"))
-                continue
+        if APPLY_FILE is not None:
+            with open(APPLY_FILE, "r") as plan_file:
+                plan = json.load(plan_file)
+            await apply_plan(client, plan)
+            print("Applied the plan %s:" % APPLY_FILE)
+            print_plan(plan)
+            return
+
+        spotlights = iter_spotlights(load_spotlights())
+
+        if PLAN_FILE is not None:
+            plan = await plan_spotlights(client, spotlights)
+            with open(PLAN_FILE, "w") as plan_file:
+                json.dump(plan, plan_file, indent=2, default=str)
+            print("Wrote the plan to %s:" % PLAN_FILE)
+            print_plan(plan)
+            print(
+                "%d spotlights would be created, %d updated and %d left unchanged."
+                % (len(plan["created"]), len(plan["updated"]), len(plan["exists"]))
+            )
+            if len(plan["errors"]) > 0:
+                print(
+                    "The following spotlights were skipped because there were errors:"
+                )
+                for name, reason in plan["errors"]:
+                    print("  %s: %s" % (name, reason))
+            return
 
-            await add_spotlight(client, spot)
-            await add_spotlight_urls(client, spot)
-            await add_license(client, spot)
-            await add_keywords(client, spot)
-            await add_research_field(client, spot)
-            await add_organisations(client, spot)
-            created_spotlights.append(spot.get("name"))
+        open_journal()
+        complete = False
+        try:
+            if DELETE_SPOTLIGHTS:
+                # update existing -> remove first, which requires all spotlights
+                spotlights = [item async for item in iterate_in_thread(spotlights)]
+                await remove_spotlights(
+                    client,
+                    [
+                        spot
+                        for _, spot, error in spotlights
+                        if error is None and check_spotlight(spot) is None
+                        # keep the spotlights recreated before an interruption
+                        and JOURNAL.get(name_to_slug(spot.get("name")), {}).get("step")
+                        != "done"
+                    ],
+                )
+
+            if INCREMENTAL:
+                load_state()
+
+            try:
+                if BULK:
+                    results = await migrate_spotlights_bulk(client, spotlights)
+                else:
+                    results = await migrate_spotlights(client, spotlights)
+            finally:
+                if INCREMENTAL:
+                    save_state()
+            complete = all(status != "error" for _, status, _ in results)
+        finally:
+            close_journal(complete)
+
+    for name, status, reason in results:
+        if status == "created":
+            created_spotlights.append(name)
+        elif status == "updated":
+            updated_spotlights.append(name)
+        elif status == "exists":
+            skipped_no_update.append(name)
+        else:
+            skipped_errors.append([name, reason])
 
     if len(created_spotlights) == 0:
         print("No new spotlights created.")
@@ -696,6 +2083,10 @@ async def main():
         print("The following spotlights were created:")
         for name in created_spotlights:
             print("  %s" % name)
+    if len(updated_spotlights) > 0:
+        print("The following spotlights were updated:")
+        for name in updated_spotlights:
+            print("  %s" % name)
     if len(skipped_no_update) > 0:
         print("The following spoltights already existed and were not updated:")
         for name in skipped_no_update:
@@ -715,34 +2106,189 @@ def init_parser() -> argparse.ArgumentParser:
         description="Migrate Software spotlights from a local file path to the RSD.",
         usage="%(prog)s [OPTION] PATH",
     )
-    parser.add_argument(
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument(
         "-d",
         "--delete_all",
         action="store_true",
         help="Delete all spotlights and overwrite with current versions.",
     )
+    mode.add_argument(
+        "-u",
+        "--update",
+        action="store_true",
+        help="Update existing spotlights in place, only changing what differs.",
+    )
+    mode.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Update existing spotlights in place if they changed since the last "
+        "incremental run.",
+    )
+    parser.add_argument(
+        "--state",
+        default=STATE_FILE,
+        metavar="FILE",
+        help="File with the state of the last incremental run "
+        "(default: %(default)s).",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue an interrupted run: skip the spotlights it completed and "
+        "complete the ones it started.",
+    )
+    parser.add_argument(
+        "--journal",
+        default=JOURNAL_FILE,
+        metavar="FILE",
+        help="File recording the progress of the current run, which is removed "
+        "once the run is complete (default: %(default)s).",
+    )
     parser.add_argument(
         "-i",
         "--update_imprint",
         action="store_true",
         help="Update imprint if it already exists.",
     )
+    parser.add_argument(
+        "-c",
+        "--concurrency",
+        type=int,
+        default=1,
+        metavar="N",
+        help="Number of spotlights to migrate concurrently (default: 1).",
+    )
+    parser.add_argument(
+        "-b",
+        "--bulk",
+        action="store_true",
+        help="Add all new spotlights with a few array inserts per table.",
+    )
+    parser.add_argument(
+        "--rpc",
+        action="store_true",
+        help="Experimental: migrate every spotlight in a single transaction with "
+        "the SQL function in resources/migrate_spotlight.sql, which must be "
+        "installed in the RSD.",
+    )
+    plan = parser.add_mutually_exclusive_group()
+    plan.add_argument(
+        "--plan",
+        metavar="FILE",
+        help="Write the changes to FILE instead of the RSD. Existing spotlights are "
+        "only compared with --update.",
+    )
+    plan.add_argument(
+        "--apply",
+        metavar="FILE",
+        help="Apply the changes of a plan written with --plan. PATH is not needed.",
+    )
+    parser.add_argument(
+        "-p",
+        "--parse-workers",
+        type=int,
+        default=1,
+        metavar="N",
+        help="Number of processes to parse the spotlight files with (default: 1).",
+    )
+    parser.add_argument(
+        "--read-workers",
+        type=int,
+        default=READ_WORKERS,
+        metavar="N",
+        help="Number of threads reading the spotlight files (default: %(default)s).",
+    )
+    parser.add_argument(
+        "--max-connections",
+        type=int,
+        default=MAX_CONNECTIONS,
+        metavar="N",
+        help="Maximum number of connections to the RSD (default: %(default)s).",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=TIMEOUT,
+        metavar="SECONDS",
+        help="Timeout of every request (default: %(default)s).",
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=RETRIES,
+        metavar="N",
+        help="Number of retries of failed requests (default: %(default)s).",
+    )
+    parser.add_argument(
+        "--cache",
+        metavar="FILE",
+        help="Cache parsed spotlights in FILE and reuse them for unchanged files.",
+    )
+    parser.add_argument(
+        "--metrics",
+        metavar="FILE",
+        help="Write the timings of all requests and phases to FILE, in the text "
+        "format of Prometheus if FILE ends with .prom, else as JSON.",
+    )
     parser.add_argument(
         "-v", "--verbose", action="store_true", help="Increase verbosity."
     )
-    parser.add_argument("PATH", help="The file path where to find the spotlights.")
+    parser.add_argument(
+        "PATH", nargs="?", help="The file path where to find the spotlights."
+    )
     return parser
 
 
 if __name__ == "__main__":
     mdparser = init_parser()
     args = mdparser.parse_args()
+    if args.concurrency < 1:
+        mdparser.error("argument -c/--concurrency: must be at least 1")
+    if args.parse_workers < 1:
+        mdparser.error("argument -p/--parse-workers: must be at least 1")
+    if args.read_workers < 1:
+        mdparser.error("argument --read-workers: must be at least 1")
+    if args.max_connections < 1:
+        mdparser.error("argument --max-connections: must be at least 1")
+    if args.retries < 0:
+        mdparser.error("argument --retries: must not be negative")
+    if args.PATH is None and args.apply is None:
+        mdparser.error("the following arguments are required: PATH")
+    if (args.plan or args.apply) and (args.delete_all or args.incremental):
+        mdparser.error("--plan and --apply can not be used with -d or --incremental")
+    if (args.plan or args.apply) and args.resume:
+        mdparser.error("--plan and --apply can not be used with --resume")
     DELETE_SPOTLIGHTS = args.delete_all
     UPDATE_IMPRINT = args.update_imprint
+    CONCURRENCY = args.concurrency
+    BULK = args.bulk
+    RPC = args.rpc
+    MAX_CONNECTIONS = args.max_connections
+    TIMEOUT = args.timeout
+    RETRIES = args.retries
+    PLAN_FILE = args.plan
+    APPLY_FILE = args.apply
+    PARSE_WORKERS = args.parse_workers
+    READ_WORKERS = args.read_workers
+    PARSE_CACHE = args.cache
+    UPDATE_SPOTLIGHTS = args.update
+    INCREMENTAL = args.incremental
+    STATE_FILE = args.state
+    RESUME = args.resume
+    JOURNAL_FILE = args.journal
+    METRICS_FILE = args.metrics
     SPOTLIGHTS_DIR = args.PATH
     if args.verbose:
         logging.basicConfig(level=logging.INFO)
     else:
         logging.basicConfig(level=logging.WARN)
 
-    asyncio.run(main())
+    try:
+        asyncio.run(main())
+        print("Timings of the migration:")
+        print(format_table(REQUEST_STATS, PHASE_STATS))
+    finally:
+        logging.info("Requests to the RSD: %s", REQUEST_STATS.summary())
+        if METRICS_FILE is not None:
+            write_metrics(METRICS_FILE, REQUEST_STATS, PHASE_STATS)
@@ -0,0 +1,89 @@
+# SPDX-FileCopyrightText: 2024 Helmholtz Centre for Environmental Research (UFZ)
+#
+# SPDX-License-Identifier: EUPL-1.2
+
+import argparse
+import logging
+import sys
+import time
+
+from mdparser.batch import convert_files
+from mdparser.mdparser import SvHtmlParser
+
+
+def init_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="python -m mdparser",
+        description="Convert HTML in Markdown files to pure Markdown.",
+    )
+    parser.add_argument(
+        "SRC",
+        nargs="+",
+        help="Files or directories to convert. Directories are searched "
+        "recursively for *.md and *.html files.",
+    )
+    parser.add_argument(
+        "-o",
+        "--out",
+        metavar="DIR",
+        required=True,
+        help="Directory for the converted files. The directory structure "
+        "below each SRC directory is kept.",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        metavar="N",
+        help="Number of processes converting files in parallel (default: 1).",
+    )
+    parser.add_argument(
+        "--unknown-tags",
+        choices=SvHtmlParser.UNKNOWN_TAG_POLICIES,
+        default="raise",
+        help="How to treat tags that can not be converted: fail the file, keep "
+        "the HTML tag or drop it (default: raise).",
+    )
+    parser.add_argument(
+        "-v", "--verbose", action="store_true", help="Print the time of every file."
+    )
+    return parser
+
+
+def main() -> int:
+    parser = init_parser()
+    args = parser.parse_args()
+    if args.jobs < 1:
+        parser.error("argument -j/--jobs: must be at least 1")
+
+    logging.basicConfig(
+        level=logging.INFO if args.verbose else logging.WARNING,
+        format="%(message)s",
+    )
+
+    start = time.perf_counter()
+    converted = 0
+    failures = []
+    for source, target, duration, error in convert_files(
+        args.SRC, args.out, args.jobs, args.unknown_tags
+    ):
+        if error is not None:
+            logging.error("%s: failed after %.1f ms", source, 1000 * duration)
+            failures.append((source, error))
+        else:
+            logging.info("%s -> %s: %.1f ms", source, target, 1000 * duration)
+            converted += 1
+
+    print(
+        "Converted %d files in %.2f s, %d failed."
+        % (converted, time.perf_counter() - start, len(failures))
+    )
+    for source, error in failures:
+        print("  %s: %s" % (source, error))
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
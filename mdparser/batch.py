@@ -0,0 +1,136 @@
+# SPDX-FileCopyrightText: 2024 Helmholtz Centre for Environmental Research (UFZ)
+#
+# SPDX-License-Identifier: EUPL-1.2
+
+"""Convert many files from HTML to Markdown with the SvHtmlParser."""
+
+import contextlib
+import glob
+import io
+import os
+import tempfile
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator, Optional, Tuple
+
+from mdparser.mdparser import SvHtmlParser
+
+PATTERNS = ("*.md", "*.html")
+READ_SIZE = 64 * 1024
+
+
+def convert(html: str, unknown_tags: str = "raise") -> str:
+    """Convert an HTML string to Markdown."""
+    parser = SvHtmlParser(stream=io.StringIO(), unknown_tags=unknown_tags)
+    parser.feed(html)
+    return parser.close().to_markdown()
+
+
+def convert_file(source: str, target: str, unknown_tags: str = "raise") -> None:
+    """
+    Convert the file source and write the result to target.
+
+    The source is fed to the parser in chunks and the Markdown is written
+    to target while parsing. target is only replaced once the whole file
+    has been converted.
+    """
+    directory = os.path.dirname(target) or "."
+    os.makedirs(directory, exist_ok=True)
+    dst = tempfile.NamedTemporaryFile(
+        "w",
+        encoding="utf-8",
+        dir=directory,
+        prefix=os.path.basename(target) + ".",
+        suffix=".tmp",
+        delete=False,
+    )
+    try:
+        with dst, open(source, encoding="utf-8") as src:
+            parser = SvHtmlParser(stream=dst, unknown_tags=unknown_tags)
+            while chunk := src.read(READ_SIZE):
+                parser.feed(chunk)
+            parser.close()
+        os.replace(dst.name, target)
+    finally:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(dst.name)
+
+
+def try_convert_file(job: Tuple[str, str, str]) -> Tuple[float, Optional[str]]:
+    """Convert a file and return the duration together with the error that occurred."""
+    source, target, unknown_tags = job
+    start = time.perf_counter()
+    try:
+        convert_file(source, target, unknown_tags)
+        error = None
+    except Exception as exc:
+        error = "%s: %s" % (type(exc).__name__, exc)
+    return time.perf_counter() - start, error
+
+
+def find_sources(paths: Iterable[str]) -> Iterator[Tuple[str, str]]:
+    """
+    Expand paths to the files to convert.
+
+    Yields each file together with its path relative to the given directory,
+    or its base name if the file was given directly.
+    """
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path, os.path.basename(path)
+            continue
+
+        files = set()
+        for pattern in PATTERNS:
+            files.update(glob.glob(os.path.join(path, "**", pattern), recursive=True))
+        for file in sorted(files):
+            yield file, os.path.relpath(file, path)
+
+
+def convert_files(
+    paths: Iterable[str], out_dir: str, jobs: int = 1, unknown_tags: str = "raise"
+) -> Iterator[Tuple[str, str, float, Optional[str]]]:
+    """
+    Convert all files in paths and write the results to out_dir.
+
+    unknown_tags is the policy of the SvHtmlParser for tags without handler.
+
+    Yields the source, the target, the duration and the error that occurred
+    for every file in the order of paths, as soon as it is converted. A
+    failed file does not stop the conversion of the others.
+    """
+    conversions = [
+        (
+            source,
+            os.path.join(out_dir, os.path.splitext(name)[0] + ".md"),
+            unknown_tags,
+        )
+        for source, name in find_sources(paths)
+    ]
+
+    # e.g. a.md and a.html would both be written to a.md, so none of the
+    # files sharing a target is converted
+    sources = defaultdict(set)
+    for source, target, _ in conversions:
+        sources[os.path.normcase(target)].add(source)
+    unique = [job for job in conversions if len(sources[os.path.normcase(job[1])]) == 1]
+
+    with contextlib.ExitStack() as stack:
+        if jobs > 1 and len(unique) > 1:
+            executor = stack.enter_context(ProcessPoolExecutor(jobs))
+            chunksize = max(1, len(unique) // (jobs * 4))
+            results = executor.map(try_convert_file, unique, chunksize=chunksize)
+        else:
+            results = map(try_convert_file, unique)
+
+        for source, target, _ in conversions:
+            others = sorted(sources[os.path.normcase(target)] - {source})
+            if others:
+                error = "ValueError: %s is also the target of %s" % (
+                    target,
+                    ", ".join(others),
+                )
+                yield source, target, 0.0, error
+            else:
+                yield (source, target, *next(results))
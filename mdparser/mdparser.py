@@ -6,8 +6,9 @@
 # HTML Parser from
 # https://codebase.helmholtz.cloud/hub-terra/stakeholder-view/-/blob/dev/datahub/stakeholderview/migrations/0015_html_to_md.py
 
+import io
 from html.parser import HTMLParser
-from typing import List
+from typing import Callable, List, Optional, TextIO
 
 
 class MdContent:
@@ -22,13 +23,48 @@ class MdContent:
     def append(self, data) -> None:
         self.content.append(data)
 
+    def flush(self) -> None:
+        pass
+
     def to_markdown(self) -> str:
         return "".join(map(str, self.content))
 
 
+class MdWriter:
+    """Write markdown snippets to a stream as soon as they are complete."""
+
+    def __init__(self, stream: Optional[TextIO] = None) -> None:
+        self.stream = io.StringIO() if stream is None else stream
+        self.last = None
+        # snippets starting with a link, which is only complete once it is closed
+        self.pending = []
+
+    def __getitem__(self, key) -> any:
+        if key != -1:
+            raise IndexError("Only the last snippet is available.")
+        return self.last
+
+    def append(self, data) -> None:
+        self.last = data
+        if len(self.pending) > 0 or isinstance(data, MdLink):
+            self.pending.append(data)
+        else:
+            self.stream.write(str(data))
+
+    def flush(self) -> None:
+        self.stream.write("".join(map(str, self.pending)))
+        self.pending.clear()
+
+    def to_markdown(self) -> str:
+        self.flush()
+        return self.stream.getvalue()
+
+
 class MdLink:
     """Class for links"""
 
+    __slots__ = ("href", "text", "data_id", "is_id_link")
+
     def __init__(self, attrs: List) -> None:
         self.href = ""
         self.text = ""
@@ -41,15 +77,28 @@ class MdLink:
                 self.is_id_link = True
                 self.data_id = value
 
-    def text(self, text: str) -> None:
-        self.text = text.strip()
-
     def __str__(self) -> str:
         if self.is_id_link:
             return f"[{self.text}]{{{self.data_id}}}"
         return f"[{self.text}]({self.href})"
 
 
+class MdLinkText:
+    """Collect the snippets inside a link, e.g. bold text, as its text."""
+
+    def __init__(self, link: MdLink) -> None:
+        self.link = link
+
+    def __getitem__(self, key) -> any:
+        return self.link
+
+    def append(self, data) -> None:
+        self.link.text += str(data)
+
+    def flush(self) -> None:
+        pass
+
+
 class ImageSrcProcessor:
     def __init__(self, src: str) -> None:
         replacement = r"https://hifis.net/assets/img/"
@@ -66,6 +115,8 @@ class ImageSrcProcessor:
 class MdImage:
     """Class for images"""
 
+    __slots__ = ("alt", "src")
+
     def __init__(self, attrs: List) -> None:
         self.alt = ""
         self.src = ""
@@ -80,28 +131,99 @@ class MdImage:
 
 
 class SvHtmlParser(HTMLParser):
-    """Parses HTML to Markdown"""
+    """
+    Parses HTML to Markdown
+
+    By default, all snippets are collected in an MdContent. If a stream is
+    given, the snippets are written to it as soon as they are complete.
+
+    Tags are converted by the handlers in START_HANDLERS and END_HANDLERS,
+    further tags can be added with register_tag. Tags without a handler are
+    treated according to unknown_tags: "raise" raises a NotImplementedError,
+    "passthrough" keeps the HTML tag and "ignore" drops it.
+    """
 
-    def __init__(self, *, convert_charrefs: bool = True) -> None:
+    UNKNOWN_TAG_POLICIES = ("raise", "passthrough", "ignore")
+    # tags between which line breaks only separate list items and table cells
+    STRUCTURE_TAGS = {"ul", "ol", "li", "table", "thead", "tbody", "tr", "th", "td"}
+
+    def __init__(
+        self,
+        *,
+        convert_charrefs: bool = True,
+        stream: Optional[TextIO] = None,
+        unknown_tags: str = "raise",
+    ) -> None:
         super().__init__(convert_charrefs=convert_charrefs)
+        if unknown_tags not in self.UNKNOWN_TAG_POLICIES:
+            raise ValueError(f"Unknown tag policy {unknown_tags!r}")
+
+        self.unknown_tags = unknown_tags
+        # copies, so that registering a tag does not change other parsers
+        self.start_handlers = dict(self.START_HANDLERS)
+        self.end_handlers = dict(self.END_HANDLERS)
         self.inside_a = False
         self.inside_div = False
         self.inside_span = False
         self.inside_tt = False
         self.inside_icon = False
         self.inside_italic = False
-        self.output = MdContent()
+        self.inside_pre = False
+        self.inside_table = False
+        # whether the last tag was one of STRUCTURE_TAGS, without text since
+        self.at_boundary = False
+        self.link = None
+        self.link_output = None
+        self.lists = []
+        self.table_rows = 0
+        self.table_cells = 0
+        self.output = MdContent() if stream is None else MdWriter(stream)
+
+    def register_tag(
+        self,
+        tag: str,
+        start: Optional[Callable[["SvHtmlParser", List], None]] = None,
+        end: Optional[Callable[["SvHtmlParser"], None]] = None,
+    ) -> None:
+        """
+        Convert tag with the given handlers.
 
-    def close(self) -> MdContent:
+        start is called with the parser and the attributes of the tag, end
+        with the parser only.
+        """
+        self.start_handlers[tag] = start or SvHtmlParser.ignore_tag
+        if end is not None:
+            self.end_handlers[tag] = end
+
+    def close(self) -> MdContent | MdWriter:
         super().close()
+        # a link which is still open ends with the document
+        self.end_a()
+        self.output.flush()
         return self.output
 
     def handle_comment(self, data: str) -> None:
         self.output.append(f"<!-- {data.strip()} -->")
 
     def handle_data(self, data: str) -> None:
+        at_boundary, self.at_boundary = self.at_boundary, False
+        if self.inside_pre:
+            self.output.append(data)
+            return
+        if (self.lists or self.inside_table) and data.isspace() and "\n" in data:
+            if at_boundary:
+                # Do not parse the line breaks between list items and table cells
+                self.at_boundary = True
+            else:
+                # but keep the words around other line breaks apart
+                self.output.append(" ")
+            return
+        if self.inside_table:
+            # a line break would end the row
+            data = data.replace("\n", " ")
+
         if self.inside_a:
-            self.output[-1].text = data
+            self.link.text += data
         elif self.inside_div and data.isspace():
             # Do not parse indentation
             return
@@ -111,54 +233,221 @@ class SvHtmlParser(HTMLParser):
             self.output.append(data)
 
     def handle_endtag(self, tag: str) -> None:
-        if tag == "a":
-            self.inside_a = False
-        elif tag == "b":
-            self.output.append(r"**")
-        elif tag == "div":
-            self.inside_div = False
-        elif tag == "span":
-            self.inside_span = False
-        elif tag == "tt":
-            self.output.append(r"`")
-            self.inside_tt = False
-        elif tag == "i":
-            if self.inside_italic:
-                self.output.append(r"*")
-                self.inside_italic = False
-            else:
-                self.inside_icon = False
+        self.at_boundary = tag in self.STRUCTURE_TAGS
+        handler = self.end_handlers.get(tag)
+        if handler is not None:
+            handler(self)
+        elif tag not in self.start_handlers and self.unknown_tags == "passthrough":
+            self.output.append(f"</{tag}>")
 
     def handle_starttag(self, tag: str, attrs: List) -> None:
-        if tag == "a":
-            self.inside_a = True
-            self.output.append(MdLink(attrs))
-        elif tag == "b":
-            self.output.append(r"**")
-        elif tag == "br":
-            self.output.append("<br>")
-        elif tag == "p":
-            self.output.append("\n\n")
-        elif tag == "div":
-            self.inside_div = True
-        elif tag == "img":
-            self.output.append(MdImage(attrs))
-        elif tag == "span":
-            self.inside_span = True
-        elif tag == "tt":
-            self.inside_tt = True
-            self.output.append(r"`")
-        elif tag == "i":
-            if len(attrs) > 0:
-                # We are in an icon, skip this
-                self.inside_icon = True
-                return
-            else:
-                self.inside_italic = True
-                self.output.append(r"*")
-        elif tag == "iframe" or tag == "centered" or tag == "center" or tag == "video":
-            return
-        else:
+        self.at_boundary = tag in self.STRUCTURE_TAGS
+        handler = self.start_handlers.get(tag)
+        if handler is not None:
+            handler(self, attrs)
+        elif self.unknown_tags == "passthrough":
+            self.output.append(self.get_starttag_text())
+        elif self.unknown_tags == "raise":
             raise NotImplementedError(
                 f"{tag} tags are not implemented.\n\n" f"Last output: {self.output[-1]}"
             )
+
+    def ignore_tag(self, attrs: List) -> None:
+        return
+
+    def start_a(self, attrs: List) -> None:
+        if self.inside_a:
+            # links can not be nested, a new one ends the current link
+            self.end_a()
+        self.inside_a = True
+        self.link = MdLink(attrs)
+        self.output.append(self.link)
+        self.link_output, self.output = self.output, MdLinkText(self.link)
+
+    def end_a(self) -> None:
+        if not self.inside_a:
+            return
+        self.inside_a = False
+        self.output = self.link_output
+        self.output.flush()
+
+    def start_b(self, attrs: List) -> None:
+        self.output.append(r"**")
+
+    def end_b(self) -> None:
+        self.output.append(r"**")
+
+    def start_br(self, attrs: List) -> None:
+        self.output.append("<br>")
+
+    def start_p(self, attrs: List) -> None:
+        self.output.append("\n\n")
+
+    def start_div(self, attrs: List) -> None:
+        self.inside_div = True
+
+    def end_div(self) -> None:
+        self.inside_div = False
+
+    def start_img(self, attrs: List) -> None:
+        self.output.append(MdImage(attrs))
+
+    def start_span(self, attrs: List) -> None:
+        self.inside_span = True
+
+    def end_span(self) -> None:
+        self.inside_span = False
+
+    def start_tt(self, attrs: List) -> None:
+        self.inside_tt = True
+        self.output.append(r"`")
+
+    def end_tt(self) -> None:
+        self.output.append(r"`")
+        self.inside_tt = False
+
+    def start_i(self, attrs: List) -> None:
+        if len(attrs) > 0:
+            # We are in an icon, skip this
+            self.inside_icon = True
+        else:
+            self.inside_italic = True
+            self.output.append(r"*")
+
+    def end_i(self) -> None:
+        if self.inside_italic:
+            self.output.append(r"*")
+            self.inside_italic = False
+        else:
+            self.inside_icon = False
+
+    def start_heading(self, attrs: List) -> None:
+        level = int(self.lasttag[1])
+        self.output.append("\n\n" + "#" * level + " ")
+
+    def end_heading(self) -> None:
+        self.output.append("\n\n")
+
+    def start_list(self, attrs: List) -> None:
+        if not self.lists:
+            self.output.append("\n")
+        self.lists.append([self.lasttag, 0])
+
+    def end_list(self) -> None:
+        self.lists.pop()
+        if not self.lists:
+            self.output.append("\n\n")
+
+    def start_li(self, attrs: List) -> None:
+        if not self.lists:
+            # list item without list
+            self.output.append("\n- ")
+            return
+
+        # nested lists are indented by the width of the parent markers
+        indent = "".join(
+            "  " if tag == "ul" else " " * len(f"{count}. ")
+            for tag, count in self.lists[:-1]
+        )
+        current = self.lists[-1]
+        current[1] += 1
+        marker = "- " if current[0] == "ul" else f"{current[1]}. "
+        self.output.append("\n" + indent + marker)
+
+    def start_code(self, attrs: List) -> None:
+        if not self.inside_pre:
+            self.output.append(r"`")
+
+    def end_code(self) -> None:
+        if not self.inside_pre:
+            self.output.append(r"`")
+
+    def start_pre(self, attrs: List) -> None:
+        self.inside_pre = True
+        self.output.append("\n\n```\n")
+
+    def end_pre(self) -> None:
+        self.inside_pre = False
+        self.output.append("\n```\n\n")
+
+    def start_table(self, attrs: List) -> None:
+        self.inside_table = True
+        self.table_rows = 0
+        self.output.append("\n")
+
+    def end_table(self) -> None:
+        self.inside_table = False
+        self.output.append("\n\n")
+
+    def start_tr(self, attrs: List) -> None:
+        self.table_cells = 0
+        self.output.append("\n|")
+
+    def end_tr(self) -> None:
+        self.table_rows += 1
+        if self.table_rows == 1:
+            # the first row is the header
+            self.output.append("\n|" + " --- |" * self.table_cells)
+
+    def start_cell(self, attrs: List) -> None:
+        self.output.append(" ")
+
+    def end_cell(self) -> None:
+        self.table_cells += 1
+        self.output.append(" |")
+
+    START_HANDLERS = {
+        "a": start_a,
+        "b": start_b,
+        "br": start_br,
+        "p": start_p,
+        "div": start_div,
+        "img": start_img,
+        "span": start_span,
+        "tt": start_tt,
+        "i": start_i,
+        "iframe": ignore_tag,
+        "centered": ignore_tag,
+        "center": ignore_tag,
+        "video": ignore_tag,
+        "h1": start_heading,
+        "h2": start_heading,
+        "h3": start_heading,
+        "h4": start_heading,
+        "h5": start_heading,
+        "h6": start_heading,
+        "ul": start_list,
+        "ol": start_list,
+        "li": start_li,
+        "code": start_code,
+        "pre": start_pre,
+        "table": start_table,
+        "thead": ignore_tag,
+        "tbody": ignore_tag,
+        "tr": start_tr,
+        "th": start_cell,
+        "td": start_cell,
+    }
+
+    END_HANDLERS = {
+        "a": end_a,
+        "b": end_b,
+        "div": end_div,
+        "span": end_span,
+        "tt": end_tt,
+        "i": end_i,
+        "h1": end_heading,
+        "h2": end_heading,
+        "h3": end_heading,
+        "h4": end_heading,
+        "h5": end_heading,
+        "h6": end_heading,
+        "ul": end_list,
+        "ol": end_list,
+        "code": end_code,
+        "pre": end_pre,
+        "table": end_table,
+        "tr": end_tr,
+        "th": end_cell,
+        "td": end_cell,
+    }
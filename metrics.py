@@ -0,0 +1,228 @@
+# SPDX-FileCopyrightText: 2024 Helmholtz Centre for Environmental Research (UFZ)
+#
+# SPDX-License-Identifier: EUPL-1.2
+
+"""
+Timings of the requests and phases of a migration.
+
+The collected metrics can be printed as a table or exported as JSON or in
+the text format of Prometheus, e.g. for the textfile collector of the node
+exporter.
+"""
+
+import contextlib
+import functools
+import json
+import math
+import os
+import statistics
+import time
+from collections import defaultdict
+
+# upper bounds of the latency histograms in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PROMETHEUS_PREFIX = "spotlight_migration"
+
+
+class Histogram:
+    """Observed durations in seconds."""
+
+    def __init__(self) -> None:
+        self.values = []
+
+    def observe(self, value: float) -> None:
+        self.values.append(value)
+
+    @property
+    def count(self) -> int:
+        return len(self.values)
+
+    @property
+    def sum(self) -> float:
+        return sum(self.values)
+
+    def mean(self) -> float:
+        return statistics.fmean(self.values) if self.values else 0.0
+
+    def quantile(self, q: float) -> float:
+        """Return the q-quantile with the nearest-rank method."""
+        if not self.values:
+            return 0.0
+        values = sorted(self.values)
+        return values[max(0, math.ceil(q * len(values)) - 1)]
+
+    def max(self) -> float:
+        return max(self.values, default=0.0)
+
+    def buckets(self, bounds=LATENCY_BUCKETS):
+        """Return the cumulative number of values up to each bound."""
+        return [(bound, sum(1 for v in self.values if v <= bound)) for bound in bounds]
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.mean(),
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "max": self.max(),
+            "buckets": {str(bound): count for bound, count in self.buckets()},
+        }
+
+
+class PhaseStats:
+    """Durations of the phases of a migration, e.g. adding the keywords."""
+
+    def __init__(self) -> None:
+        self.phases = defaultdict(Histogram)
+
+    @contextlib.contextmanager
+    def time(self, phase: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[phase].observe(time.perf_counter() - start)
+
+    def timed(self, phase: str):
+        """Decorate a coroutine function to record its duration as phase."""
+
+        def decorator(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                with self.time(phase):
+                    return await func(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+
+def format_table(requests, phases) -> str:
+    """Format the RequestStats and PhaseStats as a table."""
+    lines = [
+        "%-32s %7s %10s %9s %9s %9s"
+        % ("Phase", "Count", "Total s", "Mean ms", "p95 ms", "Max ms")
+    ]
+    for phase, histogram in phases.phases.items():
+        lines.append(
+            "%-32s %7d %10.2f %9.1f %9.1f %9.1f"
+            % (
+                phase,
+                histogram.count,
+                histogram.sum,
+                1000 * histogram.mean(),
+                1000 * histogram.quantile(0.95),
+                1000 * histogram.max(),
+            )
+        )
+
+    lines.append("")
+    lines.append(
+        "%-32s %7s %7s %10s %10s %9s %9s"
+        % ("Request", "Count", "Failed", "Sent KiB", "Recv KiB", "Mean ms", "p95 ms")
+    )
+    for key, histogram in sorted(requests.latencies.items()):
+        lines.append(
+            "%-32s %7d %7d %10.1f %10.1f %9.1f %9.1f"
+            % (
+                "%s %s" % key,
+                histogram.count,
+                requests.failures[key],
+                requests.bytes_sent[key] / 1024,
+                requests.bytes_received[key] / 1024,
+                1000 * histogram.mean(),
+                1000 * histogram.quantile(0.95),
+            )
+        )
+    return "\n".join(lines)
+
+
+def to_json(requests, phases) -> dict:
+    return {
+        "phases": {
+            phase: histogram.to_dict() for phase, histogram in phases.phases.items()
+        },
+        "requests": [
+            {
+                "method": method,
+                "table": table,
+                "failures": requests.failures[(method, table)],
+                "bytes_sent": requests.bytes_sent[(method, table)],
+                "bytes_received": requests.bytes_received[(method, table)],
+                **histogram.to_dict(),
+            }
+            for (method, table), histogram in sorted(requests.latencies.items())
+        ],
+        "retries": dict(requests.retries),
+    }
+
+
+def prometheus_histogram(name, labels, histogram):
+    lines = []
+    for bound, count in histogram.buckets():
+        lines.append('%s_bucket{%s,le="%s"} %d' % (name, labels, bound, count))
+    lines.append('%s_bucket{%s,le="+Inf"} %d' % (name, labels, histogram.count))
+    lines.append("%s_sum{%s} %f" % (name, labels, histogram.sum))
+    lines.append("%s_count{%s} %d" % (name, labels, histogram.count))
+    return lines
+
+
+def to_prometheus(requests, phases) -> str:
+    prefix = PROMETHEUS_PREFIX
+    lines = [
+        "# HELP %s_phase_duration_seconds Duration of the phases of the migration."
+        % prefix,
+        "# TYPE %s_phase_duration_seconds histogram" % prefix,
+    ]
+    for phase, histogram in phases.phases.items():
+        lines += prometheus_histogram(
+            prefix + "_phase_duration_seconds", 'phase="%s"' % phase, histogram
+        )
+
+    lines += [
+        "# HELP %s_request_duration_seconds Latency of the requests to the RSD."
+        % prefix,
+        "# TYPE %s_request_duration_seconds histogram" % prefix,
+    ]
+    for (method, table), histogram in sorted(requests.latencies.items()):
+        lines += prometheus_histogram(
+            prefix + "_request_duration_seconds",
+            'method="%s",table="%s"' % (method, table),
+            histogram,
+        )
+
+    for name, counter, description in (
+        ("request_failures", requests.failures, "Requests which failed finally."),
+        ("request_sent_bytes", requests.bytes_sent, "Bytes sent to the RSD."),
+        ("request_received_bytes", requests.bytes_received, "Bytes received."),
+    ):
+        lines.append("# HELP %s_%s_total %s" % (prefix, name, description))
+        lines.append("# TYPE %s_%s_total counter" % (prefix, name))
+        for method, table in sorted(requests.latencies):
+            lines.append(
+                '%s_%s_total{method="%s",table="%s"} %d'
+                % (prefix, name, method, table, counter[(method, table)])
+            )
+
+    lines.append("# HELP %s_retries_total Retried requests by reason." % prefix)
+    lines.append("# TYPE %s_retries_total counter" % prefix)
+    for reason, count in sorted(requests.retries.items()):
+        lines.append('%s_retries_total{reason="%s"} %d' % (prefix, reason, count))
+    return "\n".join(lines) + "\n"
+
+
+def write_metrics(filename, requests, phases) -> None:
+    """
+    Write the metrics to filename.
+
+    Files ending with .prom are written in the text format of Prometheus,
+    all others as JSON. The file is replaced at once, so a collector never
+    reads a partial file.
+    """
+    with open(filename + ".tmp", "w") as metrics:
+        if filename.endswith(".prom"):
+            metrics.write(to_prometheus(requests, phases))
+        else:
+            json.dump(to_json(requests, phases), metrics, indent=2)
+    os.replace(filename + ".tmp", filename)
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+
+# SPDX-FileCopyrightText: 2024 Helmholtz Centre for Environmental Research (UFZ)
+#
+# SPDX-License-Identifier: EUPL-1.2
+
+"""
+Check the syntax of SQL files with the parser of PostgreSQL.
+
+The statements are parsed with pglast, the bodies of PL/pgSQL functions
+together with the statements and expressions in them. Names of tables and
+columns are not checked against the schema of the RSD. By default, all SQL
+files in this directory are checked, e.g.
+
+    poetry run python resources/check_sql.py
+"""
+
+import argparse
+import glob
+import os
+import sys
+
+import pglast
+from pglast.parser import ParseError
+
+# parse modes of the SQL embedded in PL/pgSQL, see RawParseMode in PostgreSQL
+PARSE_DEFAULT = 0
+PARSE_TYPE_NAME = 1
+PARSE_EXPRESSION = 2
+
+
+def embedded_sql(node):
+    """Yield the SQL of a parsed PL/pgSQL function as (parse mode, query)."""
+    if isinstance(node, dict):
+        if "PLpgSQL_expr" in node:
+            expr = node["PLpgSQL_expr"]
+            yield expr["parseMode"], expr["query"]
+        for value in node.values():
+            yield from embedded_sql(value)
+    elif isinstance(node, list):
+        for value in node:
+            yield from embedded_sql(value)
+
+
+def as_statement(mode, query):
+    """Return the embedded SQL as a statement which can be parsed on its own."""
+    if mode == PARSE_DEFAULT:
+        return query
+    if mode == PARSE_TYPE_NAME:
+        return "SELECT NULL::" + query
+    if mode == PARSE_EXPRESSION:
+        return "SELECT " + query
+    # assignments, "target := expression"
+    return "SELECT " + query.split(":=", 1)[1]
+
+
+def check_file(filename):
+    """Return the syntax errors of an SQL file."""
+    with open(filename, "r") as sql_file:
+        sql = sql_file.read()
+
+    try:
+        statements = pglast.parse_sql(sql)
+    except ParseError as exc:
+        return ["%s: %s" % (filename, exc)]
+
+    errors = []
+    for statement in statements:
+        if type(statement.stmt).__name__ != "CreateFunctionStmt":
+            continue
+        start = statement.stmt_location
+        source = (
+            sql[start : start + statement.stmt_len]
+            if statement.stmt_len
+            else sql[start:]
+        )
+        if "plpgsql" not in source.lower():
+            continue
+
+        try:
+            functions = pglast.parse_plpgsql(source + ";")
+        except ParseError as exc:
+            errors.append("%s: %s" % (filename, exc))
+            continue
+
+        for mode, query in embedded_sql(functions):
+            try:
+                pglast.parse_sql(as_statement(mode, query))
+            except ParseError as exc:
+                errors.append("%s: %s in %r" % (filename, exc, query))
+    return errors
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "files",
+        nargs="*",
+        metavar="FILE",
+        help="SQL files to check (default: resources/*.sql).",
+    )
+    args = parser.parse_args()
+
+    files = args.files or sorted(
+        glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), "*.sql"))
+    )
+    errors = []
+    for filename in files:
+        errors += check_file(filename)
+    for error in errors:
+        print(error)
+    print("Checked %d files, %d errors." % (len(files), len(errors)))
+    sys.exit(1 if errors else 0)
@@ -0,0 +1,166 @@
+-- SPDX-FileCopyrightText: 2024 Helmholtz Centre for Environmental Research (UFZ)
+--
+-- SPDX-License-Identifier: EUPL-1.2
+
+-- Create or update a software spotlight together with its repository URL,
+-- licenses, keywords and organisations in a single transaction. Called by
+-- `main.py --rpc` through the PostgREST endpoint /rpc/migrate_spotlight.
+--
+-- The payload has the following structure:
+--
+--   {
+--     "software": {"slug": ..., "brand_name": ..., ...},
+--     "repository_url": {"code_platform": ..., "url": ...} or null,
+--     "licenses": ["MIT"],
+--     "keywords": ["Python", "Earth and Environment"],
+--     "organisations": ["<organisation id>", ...]
+--   }
+--
+-- Existing software is matched by slug and keeps its id. Its columns are set
+-- to the values of "software" and related entries which are not contained in
+-- the payload are removed. Missing keywords are created, organisations must
+-- exist already. Returns the id of the software and whether it was created
+-- or changed.
+--
+-- Experimental: not yet tested against the database of a real RSD.
+
+CREATE OR REPLACE FUNCTION migrate_spotlight(payload JSONB)
+RETURNS TABLE (software_id UUID, created BOOLEAN, changed BOOLEAN)
+LANGUAGE plpgsql VOLATILE AS
+$$
+DECLARE
+	v_software software;
+	v_ids UUID[];
+	v_count INTEGER;
+BEGIN
+	v_software := jsonb_populate_record(NULL::software, payload->'software');
+	created := FALSE;
+	changed := FALSE;
+
+	SELECT software.id INTO software_id FROM software WHERE software.slug = v_software.slug;
+
+	IF software_id IS NULL THEN
+		INSERT INTO software (slug, brand_name, concept_doi, description, get_started_url, is_published, short_statement)
+		VALUES (
+			v_software.slug,
+			v_software.brand_name,
+			v_software.concept_doi,
+			v_software.description,
+			v_software.get_started_url,
+			v_software.is_published,
+			v_software.short_statement
+		)
+		RETURNING software.id INTO software_id;
+		created := TRUE;
+		changed := TRUE;
+	ELSE
+		UPDATE software SET
+			brand_name = v_software.brand_name,
+			concept_doi = v_software.concept_doi,
+			description = v_software.description,
+			get_started_url = v_software.get_started_url,
+			is_published = v_software.is_published,
+			short_statement = v_software.short_statement
+		WHERE software.id = software_id AND (
+			software.brand_name,
+			software.concept_doi,
+			software.description,
+			software.get_started_url,
+			software.is_published,
+			software.short_statement
+		) IS DISTINCT FROM (
+			v_software.brand_name,
+			v_software.concept_doi,
+			v_software.description,
+			v_software.get_started_url,
+			v_software.is_published,
+			v_software.short_statement
+		);
+		GET DIAGNOSTICS v_count = ROW_COUNT;
+		changed := v_count > 0;
+	END IF;
+
+	-- repository URL
+	IF jsonb_typeof(payload->'repository_url') = 'object' THEN
+		INSERT INTO repository_url (software, url, code_platform)
+		SELECT software_id, repository.url, repository.code_platform
+		FROM jsonb_populate_record(NULL::repository_url, payload->'repository_url') AS repository
+		ON CONFLICT (software) DO UPDATE SET
+			url = EXCLUDED.url,
+			code_platform = EXCLUDED.code_platform
+		WHERE (repository_url.url, repository_url.code_platform)
+			IS DISTINCT FROM (EXCLUDED.url, EXCLUDED.code_platform);
+	ELSE
+		DELETE FROM repository_url WHERE repository_url.software = software_id;
+	END IF;
+	GET DIAGNOSTICS v_count = ROW_COUNT;
+	changed := changed OR v_count > 0;
+
+	-- licenses
+	DELETE FROM license_for_software
+	WHERE license_for_software.software = software_id
+		AND license_for_software.license NOT IN (
+			SELECT jsonb_array_elements_text(payload->'licenses')
+		);
+	GET DIAGNOSTICS v_count = ROW_COUNT;
+	changed := changed OR v_count > 0;
+
+	INSERT INTO license_for_software (software, license)
+	SELECT DISTINCT software_id, new_license
+	FROM jsonb_array_elements_text(payload->'licenses') AS new_license
+	WHERE NOT EXISTS (
+		SELECT 1 FROM license_for_software
+		WHERE license_for_software.software = software_id
+			AND license_for_software.license = new_license
+	);
+	GET DIAGNOSTICS v_count = ROW_COUNT;
+	changed := changed OR v_count > 0;
+
+	-- keywords, which are unique regardless of their case
+	INSERT INTO keyword (value)
+	SELECT new_keyword FROM jsonb_array_elements_text(payload->'keywords') AS new_keyword
+	ON CONFLICT DO NOTHING;
+
+	SELECT COALESCE(array_agg(DISTINCT keyword.id), '{}') INTO v_ids
+	FROM keyword
+	WHERE lower(keyword.value::TEXT) IN (
+		SELECT lower(new_keyword)
+		FROM jsonb_array_elements_text(payload->'keywords') AS new_keyword
+	);
+
+	DELETE FROM keyword_for_software
+	WHERE keyword_for_software.software = software_id
+		AND keyword_for_software.keyword <> ALL (v_ids);
+	GET DIAGNOSTICS v_count = ROW_COUNT;
+	changed := changed OR v_count > 0;
+
+	INSERT INTO keyword_for_software (software, keyword)
+	SELECT software_id, unnest(v_ids)
+	ON CONFLICT DO NOTHING;
+	GET DIAGNOSTICS v_count = ROW_COUNT;
+	changed := changed OR v_count > 0;
+
+	-- organisations
+	SELECT COALESCE(array_agg(DISTINCT organisation_id::UUID), '{}') INTO v_ids
+	FROM jsonb_array_elements_text(payload->'organisations') AS organisation_id;
+
+	DELETE FROM software_for_organisation
+	WHERE software_for_organisation.software = software_id
+		AND software_for_organisation.organisation <> ALL (v_ids);
+	GET DIAGNOSTICS v_count = ROW_COUNT;
+	changed := changed OR v_count > 0;
+
+	INSERT INTO software_for_organisation (software, organisation)
+	SELECT software_id, unnest(v_ids)
+	ON CONFLICT DO NOTHING;
+	GET DIAGNOSTICS v_count = ROW_COUNT;
+	changed := changed OR v_count > 0;
+
+	RETURN NEXT;
+END
+$$;
+
+GRANT EXECUTE ON FUNCTION migrate_spotlight(JSONB) TO rsd_admin;
+
+-- make the function available in PostgREST
+NOTIFY pgrst, 'reload schema';